@@ -1,16 +1,23 @@
+from django.utils.functional import SimpleLazyObject
+
+from apps.orders.cache import get_cart_count
+
+
 def cart_count(request):
     '''Provides cart_count for navbar badges.
 
-    Returns a small context dict with the number of items in the authenticated
-    user's cart. Safe to call for anonymous users.
+    The value is lazy: nothing is looked up unless a template actually uses
+    ``cart_count``. It then comes from the per-user cached counter in
+    ``apps.orders.cache``, so the badge normally costs no query. Safe to call
+    for anonymous users.
     '''
-    count = 0
-    user = getattr(request, "user", None)
-    if user and user.is_authenticated:
+    def _count():
+        user = getattr(request, "user", None)
+        if not (user and user.is_authenticated):
+            return 0
         try:
-            cart = getattr(user, "cart", None)
-            if cart is not None:
-                count = cart.items.count()
+            return get_cart_count(user.pk)
         except Exception:
-            count = 0
-    return {"cart_count": count}
+            return 0
+
+    return {"cart_count": SimpleLazyObject(_count)}
@@ -2,6 +2,7 @@ from django.contrib import admin
 
 # Register your models here.
 from .models import Book
+from apps.orders import inventory
 
 
 @admin.register(Book)
@@ -23,3 +24,9 @@ class BookAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # a sharded book's stock lives in its shards; Book.stock alone would
+        # be overwritten by the next sync
+        if change and "stock" in form.changed_data and obj.stock_shards.exists():
+            inventory.set_stock(obj.pk, obj.stock)
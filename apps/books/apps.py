@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BooksConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.books"
+
+    def ready(self):
+        # Import signals so the search index follows Book saves/deletes
+        import apps.books.signals  # noqa
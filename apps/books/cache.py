@@ -0,0 +1,147 @@
+"""Catalog-level cache helpers.
+
+Anything cached from the catalog (counts, search results, rendered pages) is
+keyed on a *catalog version*: a counter in the default cache that is bumped
+whenever a ``Book`` is written. Bumping the counter invalidates every entry
+built from an older version at once; stale entries simply age out.
+
+Checkouts and reservations only move stock, so they bump two narrower
+counters instead: the *stock version* (whole cached pages and ETags, which
+show stock counts) and, when a book goes in or out of stock, the
+*availability version* (sets of out-of-stock books). Counts, search results
+and fragments don't depend on stock and survive checkout traffic.
+
+Processes only see each other's bumps when ``CACHES["default"]`` is shared
+(Redis/Memcached via ``CACHE_URL``); with the local-memory cache each
+process versions its own entries.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+
+CATALOG_VERSION_KEY = "books:catalog_version"
+STOCK_VERSION_KEY = "books:stock_version"
+AVAILABILITY_VERSION_KEY = "books:availability_version"
+
+
+def _get_version(key) -> int:
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def _bump_version(key) -> int:
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # key missing (first write or evicted): restart from a fresh value
+        cache.set(key, 2, timeout=None)
+        return 2
+
+
+def get_catalog_version() -> int:
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version() -> int:
+    return _bump_version(CATALOG_VERSION_KEY)
+
+
+def get_stock_version() -> int:
+    return _get_version(STOCK_VERSION_KEY)
+
+
+def get_availability_version() -> int:
+    return _get_version(AVAILABILITY_VERSION_KEY)
+
+
+def bump_stock_version(availability=False):
+    """Record a stock change; ``availability`` if a book went in or out of stock."""
+    _bump_version(STOCK_VERSION_KEY)
+    if availability:
+        _bump_version(AVAILABILITY_VERSION_KEY)
+
+
+def page_version() -> str:
+    """Versions a rendered catalog page depends on: catalog, stock and the
+    recommender model (pages embed recommendation lists)."""
+    from apps.recommender.serving import get_model_version
+
+    return f"{get_catalog_version()}:{get_stock_version()}:{get_model_version()}"
+
+
+def catalog_key(*parts) -> str:
+    """Build a cache key scoped to the current catalog version."""
+    return ":".join(["books", f"v{get_catalog_version()}", *(str(p) for p in parts)])
+
+
+def catalog_cache_timeout() -> int:
+    return getattr(settings, "BOOKS_CACHE_TIMEOUT", 600)
+
+
+def is_cacheable_request(request) -> bool:
+    """Only anonymous GET/HEAD requests without pending messages are cached:
+    everything else renders user-specific bits (cart, forms, alerts)."""
+    if request.method not in ("GET", "HEAD"):
+        return False
+    if request.user.is_authenticated:
+        return False
+    return len(get_messages(request)) == 0
+
+
+def cache_catalog_page(view):
+    """Cache a catalog view's rendered page for anonymous visitors.
+
+    Entries are keyed on the full path and ``page_version()``.
+    Responses that set cookies or used a CSRF token are not stored.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_cacheable_request(request):
+            return view(request, *args, **kwargs)
+
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        key = catalog_key("page", page_version(), path)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = view(request, *args, **kwargs)
+        if (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+        ):
+            cache.set(key, (response.content, response["Content-Type"]), catalog_cache_timeout())
+        return response
+
+    return wrapper
+
+
+def catalog_etag(request, *args, **kwargs):
+    """ETag for ``django.views.decorators.http.condition`` on catalog views.
+
+    Derived from ``page_version()`` and the full path, so it costs no
+    database work. Requests that would get user-specific content
+    get no ETag (and therefore never a 304).
+    """
+    if not is_cacheable_request(request):
+        return None
+    raw = f"{page_version()}:{request.get_full_path()}"
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def catalog_template_context() -> dict:
+    """Context used by the ``{% cache %}`` fragments in catalog templates."""
+    return {
+        "catalog_version": get_catalog_version(),
+        "catalog_cache_timeout": catalog_cache_timeout(),
+    }
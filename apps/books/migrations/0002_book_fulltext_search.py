@@ -0,0 +1,111 @@
+"""Full-text search structures for Book.
+
+PostgreSQL: a stored, weighted ``search_vector`` column (title > author >
+genre > description) with a GIN index, plus trigram GIN indexes on title and
+author for typo-tolerant fallback searches.
+
+SQLite: an external-content FTS5 table kept in sync by triggers.
+
+The column/table are managed here rather than on the model so Django never
+reads or writes them; ``apps.books.search.FullTextSearchBackend`` queries
+them directly.
+"""
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    ALTER TABLE books_book ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(author, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(genre, '')), 'C') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'D')
+    ) STORED
+    """,
+    "CREATE INDEX books_book_search_vector_gin ON books_book USING gin (search_vector)",
+    "CREATE INDEX books_book_title_trgm ON books_book USING gin (title gin_trgm_ops)",
+    "CREATE INDEX books_book_author_trgm ON books_book USING gin (author gin_trgm_ops)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS books_book_author_trgm",
+    "DROP INDEX IF EXISTS books_book_title_trgm",
+    "DROP INDEX IF EXISTS books_book_search_vector_gin",
+    "ALTER TABLE books_book DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE books_book_fts USING fts5(
+        title, author, genre, description,
+        content='books_book', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER books_book_fts_ai AFTER INSERT ON books_book BEGIN
+        INSERT INTO books_book_fts(rowid, title, author, genre, description)
+        VALUES (new.id, new.title, new.author, new.genre, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER books_book_fts_ad AFTER DELETE ON books_book BEGIN
+        INSERT INTO books_book_fts(books_book_fts, rowid, title, author, genre, description)
+        VALUES ('delete', old.id, old.title, old.author, old.genre, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER books_book_fts_au AFTER UPDATE OF title, author, genre, description ON books_book BEGIN
+        INSERT INTO books_book_fts(books_book_fts, rowid, title, author, genre, description)
+        VALUES ('delete', old.id, old.title, old.author, old.genre, old.description);
+        INSERT INTO books_book_fts(rowid, title, author, genre, description)
+        VALUES (new.id, new.title, new.author, new.genre, new.description);
+    END
+    """,
+    "INSERT INTO books_book_fts(books_book_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS books_book_fts_au",
+    "DROP TRIGGER IF EXISTS books_book_fts_ad",
+    "DROP TRIGGER IF EXISTS books_book_fts_ai",
+    "DROP TABLE IF EXISTS books_book_fts",
+]
+
+
+def _sqlite_has_fts5(cursor):
+    cursor.execute("PRAGMA compile_options")
+    return any(row[0] == "ENABLE_FTS5" for row in cursor.fetchall())
+
+
+def _run(schema_editor, postgres, sqlite):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == "postgresql":
+            statements = postgres
+        elif vendor == "sqlite" and _sqlite_has_fts5(cursor):
+            statements = sqlite
+        else:
+            # other databases keep using the icontains fallback
+            statements = []
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def forwards(apps, schema_editor):
+    _run(schema_editor, POSTGRES_FORWARD, SQLITE_FORWARD)
+
+
+def backwards(apps, schema_editor):
+    _run(schema_editor, POSTGRES_BACKWARD, SQLITE_BACKWARD)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0002_book_fulltext_search"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["created_at", "id"], name="books_book_created_f13e98_idx"
+            ),
+        ),
+    ]
@@ -23,6 +23,8 @@ class Book(models.Model):
         indexes = [
             models.Index(fields=["title"]),
             models.Index(fields=["genre"]),
+            # keyset pagination of the catalog listing
+            models.Index(fields=["created_at", "id"]),
         ]
 
     def __str__(self) -> str:
@@ -0,0 +1,289 @@
+"""Catalog pagination: keyset (cursor) paging and cached/estimated counts.
+
+Keyset pages are addressed by the sort key of a neighbouring row instead of
+an OFFSET, so every page costs an index range scan of ``per_page`` rows no
+matter how deep it is, and no ``COUNT(*)`` is needed. Cursors are opaque,
+URL-safe tokens carrying the direction, the page number (for display) and
+the key of the row to continue from.
+
+Numbered pages still need a total; ``CachedCountPaginator`` caches it per
+query and catalog version, and can use the PostgreSQL planner's estimate
+instead of counting large tables.
+"""
+import base64
+import hashlib
+import json
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .cache import catalog_key
+
+COUNT_CACHE_TIMEOUT = 15 * 60
+
+# below this many rows an exact COUNT is cheap and planner statistics are
+# too coarse to be worth showing
+ESTIMATE_MIN_ROWS = 10_000
+
+
+def estimate_count(queryset):
+    """Return the planner's row estimate for ``queryset``, or ``None``.
+
+    Unfiltered querysets read ``pg_class.reltuples``; filtered ones use the
+    top-level ``Plan Rows`` of ``EXPLAIN``. Only PostgreSQL is supported, and
+    ``None`` is also returned when the table has never been analyzed.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+            estimate = row[0] if row else None
+        else:
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = int(plan[0]["Plan"]["Plan Rows"])
+    if estimate is None or estimate < 0:
+        return None
+    return estimate
+
+
+def cached_count(queryset, key, estimate=False, timeout=COUNT_CACHE_TIMEOUT):
+    """Count ``queryset`` once per catalog version.
+
+    ``key`` identifies the query (e.g. a normalized search string) and is part
+    of the cache key together with the catalog version, so any ``Book`` write
+    invalidates the cached totals. With ``estimate`` the planner's estimate
+    is used for large tables instead of an exact ``COUNT(*)``.
+    """
+    cache_key = catalog_key("count", hashlib.md5(key.encode()).hexdigest(), int(estimate))
+    count = cache.get(cache_key)
+    if count is None:
+        count = estimate_count(queryset) if estimate else None
+        if count is None or count < ESTIMATE_MIN_ROWS:
+            count = queryset.count()
+        cache.set(cache_key, count, timeout)
+    return count
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator for catalog querysets that caches ``count``.
+
+    ``cache_key`` should identify the query (normalized search string, filter
+    values...). Pass ``estimate=True`` when an approximate total is fine,
+    e.g. for the unfiltered listing.
+    """
+
+    def __init__(self, object_list, per_page, cache_key="", estimate=False, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+        self.estimate = estimate
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, (list, tuple)):
+            return len(self.object_list)
+        return cached_count(self.object_list, self.cache_key, estimate=self.estimate)
+
+
+class KeysetPage:
+    """One page of a :class:`KeysetPaginator`.
+
+    ``cursors`` maps the page numbers that were looked up around this page to
+    the cursor that opens them (``None`` for page 1).
+    """
+
+    def __init__(self, object_list, number, has_previous, has_next, cursors):
+        self.object_list = object_list
+        self.number = number
+        self._has_previous = has_previous
+        self._has_next = has_next
+        self.cursors = cursors
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+    @property
+    def previous_cursor(self):
+        return self.cursors.get(self.number - 1)
+
+    @property
+    def next_cursor(self):
+        return self.cursors.get(self.number + 1)
+
+
+class KeysetPaginator:
+    """Paginate ``queryset`` on ``key_fields`` (the last must be unique).
+
+    ``descending`` flips the order of every key field, e.g. newest first.
+    """
+
+    def __init__(self, queryset, per_page, key_fields=("created_at", "id"), descending=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.key_fields = tuple(key_fields)
+        self.descending = descending
+        self._fields = [queryset.model._meta.get_field(f) for f in self.key_fields]
+
+    # -- cursor encoding -------------------------------------------------
+
+    def encode_cursor(self, direction, number, key):
+        # isoformat() keeps microseconds, which DjangoJSONEncoder truncates
+        values = [v.isoformat() if isinstance(v, datetime) else v for v in key]
+        raw = json.dumps([direction, number, values], cls=DjangoJSONEncoder)
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        """Return ``(direction, number, key)`` or ``None`` for a bad cursor."""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            direction, number, values = json.loads(raw)
+            if direction not in ("after", "before") or len(values) != len(self._fields):
+                return None
+            key = tuple(f.to_python(v) for f, v in zip(self._fields, values))
+            return direction, max(int(number), 1), key
+        except (ValueError, TypeError, ValidationError):
+            return None
+
+    # -- ordering helpers ------------------------------------------------
+
+    def _ordering(self, forward=True):
+        prefix = "-" if self.descending == forward else ""
+        return [prefix + f for f in self.key_fields]
+
+    def _beyond(self, key, forward=True):
+        """Q matching rows strictly after ``key`` in the given direction."""
+        op = "lt" if self.descending == forward else "gt"
+        condition = Q()
+        for i, field in enumerate(self.key_fields):
+            term = Q(**{f"{field}__{op}": key[i]})
+            for prev_field, prev_value in zip(self.key_fields[:i], key[:i]):
+                term &= Q(**{prev_field: prev_value})
+            condition |= term
+        return condition
+
+    def _key(self, obj):
+        return tuple(getattr(obj, f) for f in self.key_fields)
+
+    def _keys(self, key, forward, limit):
+        qs = self.queryset.filter(self._beyond(key, forward)).order_by(*self._ordering(forward))
+        return list(qs.values_list(*self.key_fields)[:limit])
+
+    # -- paging ----------------------------------------------------------
+
+    def cursor_for_page(self, number):
+        """Cursor opening page ``number``, for translating numbered links.
+
+        Costs one ``OFFSET`` query on the key columns. Returns None for the
+        first page and for pages past the end.
+        """
+        if number <= 1:
+            return None
+        offset = (number - 1) * self.per_page - 1
+        keys = list(self.queryset.order_by(*self._ordering()).values_list(*self.key_fields)[offset:offset + 1])
+        return self.encode_cursor("after", number, keys[0]) if keys else None
+
+    def page(self, cursor=None, window_size=None):
+        """Return the page opened by ``cursor`` (first page when missing).
+
+        With ``window_size`` the page also gets cursors for every page of its
+        aligned window (e.g. 1-5, 6-10) plus the pages just outside it, so
+        numbered links can be rendered. That costs at most two extra
+        key-only queries.
+        """
+        decoded = self.decode_cursor(cursor) if cursor else None
+        size = self.per_page
+
+        if decoded is None:
+            rows = list(self.queryset.order_by(*self._ordering())[: size + 1])
+            number, has_previous, has_next = 1, False, len(rows) > size
+            rows = rows[:size]
+        else:
+            direction, number, key = decoded
+            forward = direction == "after"
+            qs = self.queryset.filter(self._beyond(key, forward))
+            rows = list(qs.order_by(*self._ordering(forward))[: size + 1])
+            more = len(rows) > size
+            rows = rows[:size]
+            if forward:
+                has_previous, has_next = True, more
+            else:
+                rows.reverse()
+                has_previous, has_next = more, True
+                if not more:
+                    # walked back to the start of the list
+                    number = 1
+
+        cursors = {1: None, number: cursor if number > 1 else None}
+        if rows:
+            if has_previous and number > 1:
+                cursors[number - 1] = (
+                    None if number == 2
+                    else self.encode_cursor("before", number - 1, self._key(rows[0]))
+                )
+            if has_next:
+                cursors[number + 1] = self.encode_cursor("after", number + 1, self._key(rows[-1]))
+            if window_size:
+                window_start = ((number - 1) // window_size) * window_size + 1
+                cursors.update(self._window_cursors(
+                    rows, number, has_previous, has_next,
+                    window_start - 1, window_start + window_size,
+                ))
+        return KeysetPage(rows, number, has_previous, has_next, cursors)
+
+    def _window_cursors(self, rows, number, has_previous, has_next, first, last):
+        size = self.per_page
+        cursors = {}
+
+        ahead = last - number
+        if has_next and ahead > 1:
+            # keys of the rows after this page; page number+k starts at
+            # index (k-1)*size and continues after the row just before it
+            keys = self._keys(self._key(rows[-1]), True, (ahead - 1) * size + 1)
+            for k in range(2, ahead + 1):
+                if len(keys) <= (k - 1) * size:
+                    break
+                cursors[number + k] = self.encode_cursor("after", number + k, keys[(k - 1) * size - 1])
+
+        behind = number - max(first, 1)
+        if has_previous and behind > 1:
+            keys = self._keys(self._key(rows[0]), False, (behind - 1) * size)
+            for k in range(2, behind + 1):
+                target = number - k
+                if target == 1:
+                    cursors[1] = None
+                elif len(keys) >= (k - 1) * size:
+                    cursors[target] = self.encode_cursor("before", target, keys[(k - 1) * size - 1])
+        return cursors
@@ -0,0 +1,391 @@
+"""Pluggable search backends for the book catalog.
+
+``book_list`` asks the configured backend for the ids of the books matching a
+query, in display order, and then only fetches the visible page from the
+database. The backend is selected with ``settings.BOOKS_SEARCH_BACKEND``.
+``search_books`` puts an LRU result cache in front of it.
+"""
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from bisect import bisect_left, insort
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .cache import get_catalog_version
+from .models import Book
+
+DEFAULT_SEARCH_BACKEND = "apps.books.search.FullTextSearchBackend"
+
+TOKEN_RE = re.compile(r"\w+")
+
+# fields that are searched, in the order they are read from the database
+SEARCH_FIELDS = ("title", "author", "genre", "description")
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens."""
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def normalize_query(query):
+    """Canonical form of a query: its distinct tokens, sorted.
+
+    Every token must match, so token order and repeats don't change the
+    result set.
+    """
+    return " ".join(sorted(set(tokenize(query))))
+
+
+class BaseSearchBackend:
+    """Interface shared by all search backends.
+
+    ``search`` returns a list of matching book ids ordered for display. The
+    index hooks are called from the ``Book`` signals and are no-ops for
+    backends that query the database directly.
+    """
+
+    def search(self, query):
+        raise NotImplementedError
+
+    def index_book(self, book):
+        pass
+
+    def remove_book(self, book_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Substring search with ``icontains`` (every token must match a field).
+
+    Needs no index, but every search is a full table scan.
+    """
+
+    def search(self, query):
+        tokens = query.split()
+        if not tokens:
+            return []
+        combined = Q()
+        for tok in tokens:
+            tok_q = Q()
+            for field in SEARCH_FIELDS:
+                tok_q |= Q(**{f"{field}__icontains": tok})
+            combined &= tok_q
+        qs = Book.objects.filter(combined).order_by("created_at", "id")
+        return list(qs.values_list("id", flat=True))
+
+
+class InvertedIndexSearchBackend(BaseSearchBackend):
+    """In-memory inverted index over the searchable ``Book`` fields.
+
+    Each term maps to a sorted ``array`` of book ids (its postings list) and
+    the vocabulary is kept sorted, so a query token matches every indexed
+    term it is a prefix of. All tokens of a query must match (AND), like the
+    database backend. The index is built on the first search in a process and
+    kept current by the ``Book`` save/delete signals; writes that arrive while
+    a build is reading the table are replayed once it finishes. Writes made
+    by other processes move the catalog version: the next search then
+    re-reads the books updated since the last sync and drops deleted ones.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._postings = {}   # term -> array of book ids (sorted)
+        self._terms = []      # sorted vocabulary for prefix lookups
+        self._doc_terms = {}  # book id -> terms, to unindex on update/delete
+        self._sort_keys = {}  # book id -> (created_at, id)
+        # (catalog version, start time) of the last build or catch-up
+        self._synced = (None, None)
+        # book id -> saved book (None if deleted) while a build runs, else None
+        self._pending = None
+        self._pending_lock = threading.Lock()
+
+    def rebuild(self):
+        rows = Book.objects.values_list("id", "created_at", *SEARCH_FIELDS)
+        with self._lock:
+            with self._pending_lock:
+                self._pending = {}
+            self._synced = (get_catalog_version(), timezone.now())
+            self._postings = {}
+            self._terms = []
+            self._doc_terms = {}
+            self._sort_keys = {}
+            # rows arrive in id order, so postings can simply be appended
+            for book_id, created_at, *texts in rows.order_by("id").iterator(chunk_size=2000):
+                self._add(book_id, created_at, texts, append=True)
+            self._terms = sorted(self._postings)
+            # the rows read may predate writes committed during the build
+            with self._pending_lock:
+                pending, self._pending = self._pending, None
+                self._built = True
+            for book_id, book in pending.items():
+                self._remove(book_id)
+                if book is not None:
+                    self._add(book_id, book.created_at, [getattr(book, f) for f in SEARCH_FIELDS])
+
+    def _ensure_current(self):
+        """Build the index, or catch it up if the catalog version moved."""
+        if self._built and self._synced[0] == get_catalog_version():
+            return
+        with self._lock:
+            if not self._built:
+                self.rebuild()
+            elif self._synced[0] != get_catalog_version():
+                self._catch_up()
+
+    def _catch_up(self):
+        version, started = get_catalog_version(), timezone.now()
+        rows = Book.objects.filter(updated_at__gte=self._synced[1]).values_list("id", "created_at", *SEARCH_FIELDS)
+        for book_id, created_at, *texts in rows:
+            self._remove(book_id)
+            self._add(book_id, created_at, texts)
+        for book_id in set(self._doc_terms) - set(Book.objects.values_list("id", flat=True)):
+            self._remove(book_id)
+        self._synced = (version, started)
+
+    def _add(self, book_id, created_at, texts, append=False):
+        terms = set()
+        for text in texts:
+            terms.update(tokenize(text))
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                self._postings[term] = array("q", [book_id])
+                if not append:
+                    insort(self._terms, term)
+            elif append:
+                postings.append(book_id)
+            else:
+                pos = bisect_left(postings, book_id)
+                postings.insert(pos, book_id)
+        self._doc_terms[book_id] = tuple(terms)
+        self._sort_keys[book_id] = (created_at, book_id)
+
+    def _remove(self, book_id):
+        for term in self._doc_terms.pop(book_id, ()):
+            postings = self._postings[term]
+            pos = bisect_left(postings, book_id)
+            if pos < len(postings) and postings[pos] == book_id:
+                del postings[pos]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect_left(self._terms, term)]
+        self._sort_keys.pop(book_id, None)
+
+    def _defer(self, book_id, book):
+        """True if the write needs no update now: a running build will
+        replay it, or an unbuilt index will read it from the database."""
+        with self._pending_lock:
+            if self._pending is not None:
+                self._pending[book_id] = book
+                return True
+            return not self._built
+
+    def index_book(self, book):
+        if self._defer(book.pk, book):
+            return
+        with self._lock:
+            self._remove(book.pk)
+            self._add(book.pk, book.created_at, [getattr(book, f) for f in SEARCH_FIELDS])
+
+    def remove_book(self, book_id):
+        if self._defer(book_id, None):
+            return
+        with self._lock:
+            self._remove(book_id)
+
+    def _match(self, token):
+        """Ids of books having a term that starts with ``token``."""
+        matched = set()
+        pos = bisect_left(self._terms, token)
+        while pos < len(self._terms) and self._terms[pos].startswith(token):
+            matched.update(self._postings[self._terms[pos]])
+            pos += 1
+        return matched
+
+    def search(self, query):
+        tokens = set(tokenize(query))
+        if not tokens:
+            return []
+        self._ensure_current()
+        with self._lock:
+            result = None
+            # match the longest (most selective) tokens first
+            for tok in sorted(tokens, key=len, reverse=True):
+                matched = self._match(tok)
+                result = matched if result is None else result & matched
+                if not result:
+                    return []
+            return sorted(result, key=self._sort_keys.__getitem__)
+
+
+class FullTextSearchBackend(BaseSearchBackend):
+    """Relevance-ranked search using the database's full-text engine.
+
+    On PostgreSQL this matches the stored, weighted ``search_vector`` column
+    (GIN indexed) and, when nothing matches, falls back to trigram word
+    similarity on title/author so small typos still find books. On SQLite it
+    queries the FTS5 table ranked with bm25. Both structures are created by
+    migration ``books.0002``; other databases (or SQLite builds without
+    FTS5) use ``DatabaseSearchBackend``.
+    """
+
+    # bm25 column weights, same order as the FTS5 columns
+    FTS5_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+    TRIGRAM_THRESHOLD = 0.4
+
+    def __init__(self):
+        self._fallback = DatabaseSearchBackend()
+        self._has_fts5 = None
+
+    def search(self, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        if connection.vendor == "postgresql":
+            return self._search_postgres(query, tokens)
+        if connection.vendor == "sqlite" and self._sqlite_ready():
+            return self._search_sqlite(tokens)
+        return self._fallback.search(query)
+
+    def _search_postgres(self, query, tokens):
+        from django.contrib.postgres.search import (
+            SearchQuery,
+            SearchRank,
+            SearchVectorField,
+            TrigramWordSimilarity,
+        )
+        from django.db.models.expressions import RawSQL
+
+        vector = RawSQL(
+            f'"{Book._meta.db_table}"."search_vector"', [], output_field=SearchVectorField()
+        )
+        # tokens are plain \w+ words, so building a raw prefix query is safe
+        ts_query = SearchQuery(
+            " & ".join(f"{tok}:*" for tok in tokens), search_type="raw", config="english"
+        )
+        ids = list(
+            Book.objects.annotate(document=vector, rank=SearchRank(vector, ts_query))
+            .filter(document=ts_query)
+            .order_by("-rank", "created_at", "id")
+            .values_list("id", flat=True)
+        )
+        if ids:
+            return ids
+
+        # nothing matched exactly: try trigram similarity to catch typos
+        similarity = Greatest(
+            TrigramWordSimilarity(query, "title"), TrigramWordSimilarity(query, "author")
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            # the indexed ``%>`` prefilter (trigram_word_similar) compares with
+            # pg_trgm.word_similarity_threshold, 0.6 by default; lower it to
+            # TRIGRAM_THRESHOLD for this transaction only (SET LOCAL)
+            cursor.execute(
+                "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+                [str(self.TRIGRAM_THRESHOLD)],
+            )
+            return list(
+                Book.objects.filter(Q(title__trigram_word_similar=query) | Q(author__trigram_word_similar=query))
+                .annotate(similarity=similarity)
+                .filter(similarity__gte=self.TRIGRAM_THRESHOLD)
+                .order_by("-similarity", "created_at", "id")
+                .values_list("id", flat=True)
+            )
+
+    def _sqlite_ready(self):
+        if self._has_fts5 is None:
+            self._has_fts5 = "books_book_fts" in connection.introspection.table_names()
+        return self._has_fts5
+
+    def _search_sqlite(self, tokens):
+        # every token must match as a prefix (implicit AND in FTS5)
+        match = " ".join(f'"{tok}"*' for tok in tokens)
+        weights = ", ".join(str(w) for w in self.FTS5_WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT fts.rowid FROM books_book_fts AS fts"
+                " JOIN books_book AS b ON b.id = fts.rowid"
+                " WHERE books_book_fts MATCH %s"
+                f" ORDER BY bm25(books_book_fts, {weights}), b.created_at, b.id",
+                [match],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """Return the process-wide search backend configured in settings."""
+    path = getattr(settings, "BOOKS_SEARCH_BACKEND", DEFAULT_SEARCH_BACKEND)
+    return import_string(path)()
+
+
+class SearchResultCache:
+    """Bounded LRU cache of search results for one process.
+
+    Maps a normalized query to the ordered tuple of matching book ids. All
+    entries belong to one catalog version; when the shared version counter
+    moves on (any ``Book`` write) the whole cache is dropped.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+                return None
+            ids = self._entries.get(key)
+            if ids is not None:
+                self._entries.move_to_end(key)
+            return ids
+
+    def set(self, key, version, ids):
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            self._entries[key] = ids
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+@lru_cache(maxsize=None)
+def get_result_cache():
+    return SearchResultCache(getattr(settings, "BOOKS_SEARCH_CACHE_SIZE", 512))
+
+
+def search_books(query):
+    """Ordered ids of the books matching ``query``, served from the result
+    cache when the same token set was searched in this catalog version."""
+    key = normalize_query(query)
+    if not key:
+        return ()
+    result_cache = get_result_cache()
+    version = get_catalog_version()
+    ids = result_cache.get(key, version)
+    if ids is None:
+        ids = tuple(get_search_backend().search(query))
+        result_cache.set(key, version, ids)
+    return ids
@@ -0,0 +1,29 @@
+# apps/books/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version
+from .models import Book
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Book)
+def index_saved_book(sender, instance, **kwargs):
+    """Keep the search index and catalog caches current once the write is committed."""
+    def _update():
+        get_search_backend().index_book(instance)
+        bump_catalog_version()
+
+    transaction.on_commit(_update)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_deleted_book(sender, instance, **kwargs):
+    book_id = instance.pk
+
+    def _update():
+        get_search_backend().remove_book(book_id)
+        bump_catalog_version()
+
+    transaction.on_commit(_update)
@@ -1,91 +1,183 @@
-from decimal import Decimal
+import math
+import uuid
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.urls import reverse
-from django.db.models import Q
+from django.views.decorators.http import condition
 from django.core.paginator import Paginator
 from django.shortcuts import render
 
+from .cache import (
+    cache_catalog_page,
+    catalog_etag,
+    catalog_template_context,
+    is_cacheable_request,
+)
 from .models import Book
-from apps.orders.models import Cart, CartItem
+from .pagination import CachedCountPaginator, KeysetPaginator, cached_count
+from .search import search_books
+from apps.orders.models import Cart, CartItem, StockShard
+from apps.recommender import semantic, serving
+from apps.recommender.models import BookNeighbor
 
+# "customers also bought" / "similar books" titles shown on a book page
+RELATED_BOOKS = 4
 
+
+@condition(etag_func=catalog_etag)
+@cache_catalog_page
 def home(request):
     """Homepage: simple carousel + brief description + featured books."""
+    # lazy: not evaluated when the template's featured fragment is cached
     featured = Book.objects.order_by("-created_at")[:6]
-    return render(request, "books/home.html", {"featured": featured})
+    return render(request, "books/home.html", {"featured": featured, **catalog_template_context()})
+
+
+def _page_query(params, **extra):
+    """Querystring for a pagination link: current GET params plus ``extra``."""
+    query = params.copy()
+    for key, value in extra.items():
+        if value is not None:
+            query[key] = value
+    return query.urlencode()
 
 
+@condition(etag_func=catalog_etag)
+@cache_catalog_page
 def book_list(request):
-    """List or search books and paginate (6 per page). New items appear at the end."""
+    """List or search books and paginate (6 per page). New items appear at the end.
+
+    The plain listing uses keyset pagination on ``(created_at, id)`` (links
+    carry a ``cursor``) unless ``settings.BOOKS_LIST_PAGINATION`` is
+    ``"offset"``; old ``?page=N`` links are redirected to the matching
+    cursor. Search results are already an in-memory list of ids, so they
+    keep numbered ``page`` links.
+    """
     q = request.GET.get("q", "").strip()
+    semantic_mode = request.GET.get("mode") == "semantic"
 
-    # ORDER: oldest first so new books are appended at the end
-    qs = Book.objects.all().order_by("created_at")
-
-    if q:
-        tokens = [t for t in q.split() if t]
-        token_queries = []
-        for tok in tokens:
-            tok_q = (
-                Q(title__icontains=tok)
-                | Q(author__icontains=tok)
-                | Q(genre__icontains=tok)
-                | Q(description__icontains=tok)
-            )
-            token_queries.append(tok_q)
-        if token_queries:
-            combined = token_queries[0]
-            for tq in token_queries[1:]:
-                combined &= tq
-            qs = qs.filter(combined)
-
-    # Pagination: 6 per page
+    # Pagination: 6 per page, sliding 5-page window
     per_page = 6
-    paginator = Paginator(qs, per_page)
-
-    # safe page number parsing
-    try:
-        page_num = int(request.GET.get("page", 1))
-    except (TypeError, ValueError):
-        page_num = 1
-
-    page_obj = paginator.get_page(page_num)
+    window_size = 5
 
     # preserve other GET params (like q)
     params = request.GET.copy()
-    if "page" in params:
-        params.pop("page")
+    for key in ("page", "cursor"):
+        params.pop(key, None)
     qs_params = params.urlencode()
 
-    # sliding 5-page window
-    window_size = 5
-    total_pages = paginator.num_pages
+    keyset = not q and getattr(settings, "BOOKS_LIST_PAGINATION", "keyset") == "keyset"
+
+    if keyset:
+        # ORDER: oldest first so new books are appended at the end
+        paginator = KeysetPaginator(Book.objects.all(), per_page)
+        if "page" in request.GET:
+            try:
+                cursor = paginator.cursor_for_page(int(request.GET["page"]))
+            except (TypeError, ValueError):
+                cursor = None
+            query = _page_query(params, cursor=cursor)
+            return redirect(f"{request.path}?{query}" if query else request.path)
+        page_obj = paginator.page(request.GET.get("cursor"), window_size=window_size)
+        books = page_obj.object_list
+        page_queries = {p: _page_query(params, cursor=c) for p, c in page_obj.cursors.items()}
+    else:
+        # safe page number parsing
+        try:
+            page_num = int(request.GET.get("page", 1))
+        except (TypeError, ValueError):
+            page_num = 1
+
+        if q:
+            # the search backend (or, in semantic mode, the vector index)
+            # returns matching ids in display order, cached per query; only
+            # the visible page of books is loaded from the database
+            ids = semantic.search(q) if semantic_mode else search_books(q)
+            paginator = Paginator(ids, per_page)
+            page_obj = paginator.get_page(page_num)
+            books_by_id = Book.objects.in_bulk(page_obj.object_list)
+            books = [books_by_id[pk] for pk in page_obj.object_list if pk in books_by_id]
+        else:
+            paginator = CachedCountPaginator(
+                Book.objects.all().order_by("created_at", "id"), per_page,
+                cache_key="all", estimate=True,
+            )
+            page_obj = paginator.get_page(page_num)
+            books = page_obj.object_list
+        page_queries = {
+            p: _page_query(params, page=p)
+            for p in range(max(1, page_obj.number - window_size), min(paginator.num_pages, page_obj.number + window_size) + 1)
+        }
+
+    # sliding 5-page window; only pages we have links for are shown
     window_start = ((page_obj.number - 1) // window_size) * window_size + 1
-    window_end = min(window_start + window_size - 1, total_pages)
-    page_range = range(window_start, window_end + 1)
+    page_range = [p for p in range(window_start, window_start + window_size) if p in page_queries]
+    window_end = page_range[-1] if page_range else window_start
+    next_window_page = window_start + window_size
+
+    if keyset:
+        # keyset pages are never counted exactly; a cached (or planner
+        # estimated) count is enough for the "page x of about y" hint
+        count = cached_count(Book.objects.all(), "all", estimate=True)
+        total_pages = max(math.ceil(count / per_page), window_end)
+    else:
+        total_pages = paginator.num_pages
 
     context = {
-        "books": page_obj.object_list,   # iterate 'books' in template
+        "books": books,   # iterate 'books' in template
         "page_obj": page_obj,
         "paginator": paginator,
-        "page_range": page_range,
+        "page_range": [(p, page_queries[p]) for p in page_range],
         "window_start": window_start,
         "window_end": window_end,
-        "has_prev_window": window_start > 1,
-        "has_next_window": window_end < total_pages,
-        "prev_window_page": max(1, window_start - 1),
-        "next_window_page": min(total_pages, window_end + 1),
+        "total_pages": total_pages,
+        "total_pages_approximate": keyset,
+        "prev_query": page_queries.get(page_obj.number - 1, ""),
+        "next_query": page_queries.get(page_obj.number + 1, ""),
+        "has_prev_window": window_start > 1 and (window_start - 1) in page_queries,
+        "has_next_window": next_window_page in page_queries,
+        "prev_window_query": page_queries.get(window_start - 1, ""),
+        "next_window_query": page_queries.get(next_window_page, ""),
         "query": q,
+        "semantic_mode": semantic_mode,
+        "semantic_label": semantic.search_label(),
+        "keyword_query": _page_query(params, mode="keyword"),
+        "semantic_query": _page_query(params, mode="semantic"),
         "qs_params": qs_params,
+        **catalog_template_context(),
     }
     return render(request, "books/list.html", context)
 
 
+def _book_last_modified(request, slug):
+    if not is_cacheable_request(request):
+        return None
+    return Book.objects.filter(slug=slug).values_list("updated_at", flat=True).first()
+
+
+@condition(etag_func=catalog_etag, last_modified_func=_book_last_modified)
+@cache_catalog_page
 def book_detail(request, slug):
     book = get_object_or_404(Book, slug=slug)
-    return render(request, "books/detail.html", {"book": book})
+    # precomputed lists served from the cache (no query once warm)
+    also_bought = serving.for_book(book.pk, RELATED_BOOKS, BookNeighbor.KIND_CO_PURCHASE)
+    similar_books = serving.for_book(book.pk, RELATED_BOOKS, BookNeighbor.KIND_CONTENT)
+    # nearest titles in the vector index, minus the ones already listed
+    shown = {card["id"] for card in also_bought + similar_books}
+    related_titles = serving.pick(semantic.related(book, RELATED_BOOKS * 2), RELATED_BOOKS, exclude=shown)
+    return render(
+        request,
+        "books/detail.html",
+        {
+            "book": book,
+            "also_bought": also_bought,
+            "similar_books": similar_books,
+            "related_titles": related_titles,
+            **catalog_template_context(),
+        },
+    )
 
 
 @login_required
@@ -93,7 +185,7 @@ def add_to_cart(request, slug):
     """Add a book to the logged-in user's cart.
 
     Enforces: quantity >= 1 and not greater than available stock. If a CartItem
-    already exists, increase quantity but never exceed the book.stock.
+    already exists, increase quantity but never exceed the available stock.
     """
     book = get_object_or_404(Book, slug=slug)
     try:
@@ -105,12 +197,14 @@ def add_to_cart(request, slug):
         messages.error(request, "Quantity must be at least 1.")
         return redirect(book.get_absolute_url())
 
-    if not book.is_in_stock():
+    # sharded books: Book.stock is a periodic copy, check the shards
+    stock = StockShard.objects.available(book)
+    if stock <= 0:
         messages.error(request, "This book is out of stock.")
         return redirect(book.get_absolute_url())
 
-    if qty > book.stock:
-        messages.error(request, f"Cannot add more than available stock ({book.stock}).")
+    if qty > stock:
+        messages.error(request, f"Cannot add more than available stock ({stock}).")
         return redirect(book.get_absolute_url())
 
     cart, _ = Cart.objects.get_or_create(user=request.user)
@@ -127,8 +221,8 @@ def add_to_cart(request, slug):
         pass
     else:
         new_quantity = item.quantity + qty
-        if new_quantity > book.stock:
-            messages.error(request, f"You can only have up to {book.stock} of this item in your cart.")
+        if new_quantity > stock:
+            messages.error(request, f"You can only have up to {stock} of this item in your cart.")
             return redirect(book.get_absolute_url())
         item.quantity = new_quantity
 
@@ -144,12 +238,18 @@ def add_to_cart(request, slug):
 def cart_view(request):
     """Show the current user's cart and items."""
     cart, _ = Cart.objects.get_or_create(user=request.user)
-    items = list(cart.items.select_related("book").all())
-    # compute line totals to avoid needing a custom template filter
-    items_with_totals = []
-    total = Decimal("0.00")
-    for it in items:
-        line_total = (it.quantity * it.price_at_add)
-        items_with_totals.append({"item": it, "line_total": line_total})
-        total += line_total
-    return render(request, "books/cart.html", {"cart": cart, "items": items_with_totals, "total": total})
+    # line totals and the cart total are computed by the database
+    items = (
+        cart.items.select_related("book")
+        .only("cart_id", "quantity", "price_at_add", "book__title", "book__slug")
+        .with_line_total()
+        .order_by("added_at", "id")
+    )
+    total = cart.items.total()
+    return render(request, "books/cart.html", {
+        "cart": cart,
+        "items": items,
+        "total": total,
+        # a resubmitted checkout form reuses this key and gets the same order
+        "checkout_key": uuid.uuid4().hex,
+    })
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ChatbotConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.chatbot"
+
+    def ready(self):
+        from django.conf import settings
+
+        if getattr(settings, "CHATBOT_WARMUP", False):
+            from . import llm
+
+            llm.warm_up()
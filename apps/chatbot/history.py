@@ -0,0 +1,75 @@
+"""Token-budgeted conversation history for chat prompts.
+
+The prompt carries the stored conversation summary plus as many of the most
+recent messages as fit in ``CHATBOT_HISTORY_TOKENS``. Once the stored
+messages outgrow that budget (or reach the memory store's message cap), the
+oldest ones are folded into the summary (one summarization call) and only
+the newest half-budget of messages is kept, so the summary is refreshed
+every few turns rather than on every turn and the prompt size stays bounded
+however long the chat runs.
+"""
+from django.conf import settings
+
+from .memory import HUMAN
+from .tokens import MESSAGE_OVERHEAD, count_message_tokens, count_tokens
+
+
+def history_budget():
+    return getattr(settings, "CHATBOT_HISTORY_TOKENS", 1500)
+
+
+def _message_tokens(m):
+    return count_tokens(m["content"]) + MESSAGE_OVERHEAD
+
+
+def window(record, budget=None):
+    """``(summary, messages)`` to send with the next prompt.
+
+    ``messages`` are the newest stored messages that fit in ``budget`` once
+    the summary is accounted for.
+    """
+    budget = history_budget() if budget is None else budget
+    summary = record.get("summary", "")
+    remaining = budget - count_tokens(summary)
+    kept = []
+    for m in reversed(record["messages"]):
+        remaining -= _message_tokens(m)
+        if remaining < 0:
+            break
+        kept.append(m)
+    kept.reverse()
+    return summary, kept
+
+
+def split_overflow(record, budget=None, max_messages=None):
+    """``(old, recent)`` when ``record`` has outgrown ``budget`` or reached
+    ``max_messages`` messages, else ``([], messages)``.
+
+    ``old`` should be folded into the summary; ``recent`` is the newest half
+    of the budget and of ``max_messages`` (at least the latest turn). Pass
+    the memory store's message cap so short turns are summarized before the
+    store trims them.
+    """
+    budget = history_budget() if budget is None else budget
+    messages = record["messages"]
+    full = max_messages is not None and len(messages) >= max_messages
+    if not full and count_message_tokens(messages) + count_tokens(record.get("summary", "")) <= budget:
+        return [], messages
+    keep_tokens, start = budget // 2, len(messages)
+    keep_messages = len(messages) if max_messages is None else max_messages // 2
+    while (
+        start > 0
+        and len(messages) - start < keep_messages
+        and keep_tokens - _message_tokens(messages[start - 1]) >= 0
+    ):
+        keep_tokens -= _message_tokens(messages[start - 1])
+        start -= 1
+    start = min(start, max(len(messages) - 2, 0))
+    return messages[:start], messages[start:]
+
+
+def transcript(messages):
+    """Plain-text form of ``messages`` for the summarizer."""
+    return "\n".join(
+        f"{'Customer' if m['role'] == HUMAN else 'Assistant'}: {m['content']}" for m in messages
+    )
@@ -0,0 +1,171 @@
+"""Lazy access to the LangChain / OpenAI stack.
+
+Importing LangChain and the OpenAI client takes a noticeable share of a
+worker's boot time and resident memory, and most workers never serve a chat.
+Nothing here imports them until a chat actually needs them; the first call
+pays the import once per process.
+
+Set ``CHATBOT_WARMUP`` to load the stack when Django starts instead (with
+``gunicorn --preload`` the master imports it once and the forked workers
+share those pages).
+
+Chat models are long-lived and carry pooled HTTP clients, so requests reuse
+open connections to the API instead of paying a TLS handshake each time.
+"""
+import asyncio
+import os
+import sys
+import threading
+import weakref
+from functools import lru_cache
+from types import SimpleNamespace
+
+from django.conf import settings
+
+from .history import transcript
+from .memory import HUMAN
+
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _stack():
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+    from langchain_openai import ChatOpenAI
+
+    return SimpleNamespace(
+        AIMessage=AIMessage,
+        ChatOpenAI=ChatOpenAI,
+        HumanMessage=HumanMessage,
+        SystemMessage=SystemMessage,
+    )
+
+
+def is_loaded():
+    """Whether this process has imported the LLM stack yet."""
+    return "langchain_openai" in sys.modules
+
+
+def load():
+    """Import the LLM stack (thread-safe; cheap after the first call)."""
+    with _lock:
+        return _stack()
+
+
+def chat_model_name():
+    return getattr(settings, "CHATBOT_MODEL", "gpt-4o")
+
+
+def _new_chat_model():
+    import httpx
+
+    limits = httpx.Limits(max_connections=getattr(settings, "CHATBOT_MAX_CONNECTIONS", 20))
+    timeout = getattr(settings, "CHATBOT_TIMEOUT", 60)
+    return load().ChatOpenAI(
+        model=chat_model_name(),
+        openai_api_key=os.environ.get("OPENAI_API_KEY"),
+        http_client=httpx.Client(limits=limits, timeout=timeout),
+        http_async_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+        # report token usage on streamed replies too
+        stream_usage=True,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_chat_model():
+    """Process-wide chat model for sync views."""
+    return _new_chat_model()
+
+
+# an httpx.AsyncClient belongs to the event loop it was first used on, so
+# async clients are kept per loop: {loop: {name: client}}
+_loop_clients = weakref.WeakKeyDictionary()
+
+
+def _loop_local(name, factory):
+    loop = asyncio.get_running_loop()
+    clients = _loop_clients.setdefault(loop, {})
+    if name not in clients:
+        clients[name] = factory()
+    return clients[name]
+
+
+def get_async_chat_model():
+    """Chat model for the running event loop.
+
+    Under ASGI a worker runs one loop, so every async request of the worker
+    shares this model and its connection pool. Call from async code only.
+    """
+    return _loop_local("chat", _new_chat_model)
+
+
+def _new_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(
+        model=getattr(settings, "CHATBOT_EMBEDDING_MODEL", "text-embedding-3-small"),
+        openai_api_key=os.environ.get("OPENAI_API_KEY"),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_embeddings():
+    return _new_embeddings()
+
+
+def embed(text):
+    """Embedding vector of ``text`` (used by the response cache)."""
+    return get_embeddings().embed_query(text)
+
+
+async def aembed(text):
+    return await _loop_local("embeddings", _new_embeddings).aembed_query(text)
+
+
+def build_messages(system_prompt, user_msg, summary="", history=()):
+    """Chat messages for one request: system prompt (with the conversation
+    summary), earlier turns, then the new user message."""
+    stack = load()
+    if summary:
+        system_prompt = f"{system_prompt}\n\nSummary of the earlier conversation:\n{summary}"
+    messages = [stack.SystemMessage(content=system_prompt)]
+    for m in history:
+        cls = stack.HumanMessage if m["role"] == HUMAN else stack.AIMessage
+        messages.append(cls(content=m["content"]))
+    messages.append(stack.HumanMessage(content=user_msg))
+    return messages
+
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a customer and "
+    "Taylor, the Bookscart assistant. Merge the new lines into the current "
+    "summary. Keep facts the assistant may need later (order ids, books, "
+    "requests, promises made). Stay under {words} words and reply with the "
+    "summary only."
+)
+
+
+def _summary_messages(summary, messages):
+    stack = load()
+    words = getattr(settings, "CHATBOT_SUMMARY_WORDS", 150)
+    return [
+        stack.SystemMessage(content=SUMMARY_PROMPT.format(words=words)),
+        stack.HumanMessage(
+            content=f"Current summary:\n{summary or '(none)'}\n\nNew lines:\n{transcript(messages)}"
+        ),
+    ]
+
+
+def summarize(summary, messages):
+    """Fold ``messages`` into the rolling ``summary``; returns the new one."""
+    return get_chat_model().invoke(_summary_messages(summary, messages)).content.strip()
+
+
+async def asummarize(summary, messages):
+    model = get_async_chat_model()
+    return (await model.ainvoke(_summary_messages(summary, messages))).content.strip()
+
+
+def warm_up():
+    """Import the stack now rather than on the first chat."""
+    load()
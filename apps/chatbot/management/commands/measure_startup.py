@@ -0,0 +1,71 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so nothing is already imported or cached.
+CHILD = r"""
+import json, resource, sys, time
+
+started = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+
+from django.test import Client
+
+response = Client(raise_request_exception=False).get(sys.argv[1])
+request_done = time.perf_counter()
+
+from apps.chatbot import llm
+
+print(json.dumps({
+    "setup": setup_done - started,
+    "first_request": request_done - setup_done,
+    "status": response.status_code,
+    "llm_loaded": llm.is_loaded(),
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure django.setup() time, first-request latency and peak memory of "
+        "a fresh process, with the chatbot's LLM stack loaded lazily (default) "
+        "and warmed up at startup (CHATBOT_WARMUP)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="/", help="Path requested after setup.")
+        parser.add_argument("--runs", type=int, default=3, help="Processes per mode; medians are reported.")
+
+    def handle(self, *args, **options):
+        modes = [("lazy chatbot", "False"), ("warmed-up chatbot", "True")]
+        self.stdout.write(f"{'mode':<20}{'setup':>10}{'1st request':>14}{'max RSS':>12}  status  LLM loaded")
+        for label, warmup in modes:
+            results = [self._measure(options["url"], warmup) for _ in range(max(options["runs"], 1))]
+
+            def median(key):
+                return statistics.median(r[key] for r in results)
+
+            self.stdout.write(
+                f"{label:<20}{median('setup') * 1000:>8.0f}ms{median('first_request') * 1000:>12.0f}ms"
+                f"{median('max_rss_kb') / 1024:>9.0f} MB  {results[-1]['status']:>6}  {results[-1]['llm_loaded']}"
+            )
+
+    def _measure(self, url, warmup):
+        env = dict(os.environ, CHATBOT_WARMUP=warmup)
+        env.setdefault("DJANGO_SETTINGS_MODULE", "bookscart.settings")
+        proc = subprocess.run(
+            [sys.executable, "-c", CHILD, url],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise CommandError(f"Measurement process failed:\n{proc.stderr.strip()}")
+        # the last line is ours; anything before it was printed during startup
+        return json.loads(proc.stdout.strip().splitlines()[-1])
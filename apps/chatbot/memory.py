@@ -0,0 +1,208 @@
+"""Conversation memory for the chatbot, kept per session.
+
+A conversation is a small record (``{"messages": [...], "summary": str}``)
+where each message is ``{"role": "human" | "ai", "content": str}`` and
+``summary`` condenses turns that no longer fit the prompt (see
+``history.py``). Every conversation is capped at
+``CHATBOT_MEMORY_MAX_MESSAGES`` messages and ``CHATBOT_MEMORY_MAX_TOKENS``
+tokens (oldest messages go first) and expires ``CHATBOT_MEMORY_TTL`` seconds
+after its last write.
+
+The store is selected with ``settings.CHATBOT_MEMORY_STORE``:
+
+* ``CacheMemoryStore`` (default) keeps conversations in the Django cache
+  ``CHATBOT_MEMORY_CACHE`` (its own ``chatbot_memory`` alias, so catalog
+  caching cannot evict them); a Redis/Memcached or database cache shares
+  them between workers and across restarts.
+* ``LocalMemoryStore`` keeps them in this process, LRU-bounded to
+  ``CHATBOT_MEMORY_MAX_SESSIONS`` conversations.
+
+Both report usage counters through ``stats()``.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from .tokens import count_tokens
+
+DEFAULT_MEMORY_STORE = "apps.chatbot.memory.CacheMemoryStore"
+DEFAULT_MEMORY_CACHE = "chatbot_memory"
+
+HUMAN = "human"
+AI = "ai"
+
+
+def message(role, content):
+    return {"role": role, "content": content}
+
+
+def empty_record():
+    return {"messages": [], "summary": ""}
+
+
+def _record_size(record):
+    """Bytes of message and summary text held by ``record``."""
+    text = sum(len(m["content"].encode()) for m in record["messages"])
+    return text + len(record.get("summary", "").encode())
+
+
+class BaseMemoryStore:
+    """Interface shared by the memory stores.
+
+    Subclasses implement ``load``/``save``/``delete``; ``put`` and ``append``
+    apply the size and token caps.
+    """
+
+    def __init__(self):
+        self.max_messages = getattr(settings, "CHATBOT_MEMORY_MAX_MESSAGES", 20)
+        self.max_tokens = getattr(settings, "CHATBOT_MEMORY_MAX_TOKENS", 2000)
+        self.ttl = getattr(settings, "CHATBOT_MEMORY_TTL", 60 * 60)
+        self._counters = {"hits": 0, "misses": 0, "writes": 0, "trimmed_messages": 0}
+        self._counter_lock = threading.Lock()
+
+    def _count(self, name, n=1):
+        with self._counter_lock:
+            self._counters[name] += n
+
+    def load(self, session_key):
+        """The conversation of ``session_key`` (an empty one if unknown)."""
+        raise NotImplementedError
+
+    def save(self, session_key, record):
+        raise NotImplementedError
+
+    def delete(self, session_key):
+        raise NotImplementedError
+
+    def trim(self, record):
+        """Drop the oldest messages beyond the caps; returns how many."""
+        messages = record["messages"]
+        tokens = sum(count_tokens(m["content"]) for m in messages)
+        dropped = 0
+        # always keep the latest message, even if it alone is over budget
+        while len(messages) - dropped > 1 and (
+            len(messages) - dropped > self.max_messages or tokens > self.max_tokens
+        ):
+            tokens -= count_tokens(messages[dropped]["content"])
+            dropped += 1
+        if dropped:
+            del messages[:dropped]
+            self._count("trimmed_messages", dropped)
+        return dropped
+
+    def put(self, session_key, record):
+        """Save ``record`` after trimming it to the caps."""
+        self.trim(record)
+        self.save(session_key, record)
+        return record
+
+    def append(self, session_key, *messages):
+        """Add ``messages`` to the conversation and save it within the caps."""
+        record = self.load(session_key)
+        record["messages"].extend(messages)
+        return self.put(session_key, record)
+
+    def stats(self):
+        """Usage counters of this store in the current process."""
+        with self._counter_lock:
+            return dict(self._counters, store=type(self).__name__)
+
+
+class LocalMemoryStore(BaseMemoryStore):
+    """Per-process store with LRU and TTL eviction.
+
+    Conversations are lost on restart and not shared between workers; use it
+    for development or single-process deployments.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.max_sessions = getattr(settings, "CHATBOT_MEMORY_MAX_SESSIONS", 1000)
+        self._entries = OrderedDict()  # session key -> (expires_at, record)
+        self._lock = threading.Lock()
+        self._counters.update(evicted=0, expired=0)
+
+    def load(self, session_key):
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[session_key]
+                self._counters["expired"] += 1
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return empty_record()
+            self._entries.move_to_end(session_key)
+            self._counters["hits"] += 1
+            # callers mutate the record; hand out a copy
+            return {**entry[1], "messages": list(entry[1]["messages"])}
+
+    def save(self, session_key, record):
+        with self._lock:
+            self._entries[session_key] = (time.monotonic() + self.ttl, record)
+            self._entries.move_to_end(session_key)
+            self._counters["writes"] += 1
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+                self._counters["evicted"] += 1
+
+    def delete(self, session_key):
+        with self._lock:
+            self._entries.pop(session_key, None)
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            records = [record for _, record in self._entries.values()]
+        stats.update(
+            sessions=len(records),
+            max_sessions=self.max_sessions,
+            messages=sum(len(r["messages"]) for r in records),
+            bytes=sum(_record_size(r) for r in records),
+        )
+        return stats
+
+
+class CacheMemoryStore(BaseMemoryStore):
+    """Store backed by the Django cache ``CHATBOT_MEMORY_CACHE``.
+
+    With a shared cache (Redis, Memcached, database) every worker sees the
+    same conversations and they survive restarts; the cache's own eviction
+    bounds the total size. The cache cannot be enumerated, so ``stats`` only
+    has this process's traffic.
+    """
+
+    KEY_PREFIX = "chatbot:memory:"
+
+    def __init__(self):
+        super().__init__()
+        self.cache = caches[getattr(settings, "CHATBOT_MEMORY_CACHE", DEFAULT_MEMORY_CACHE)]
+        self._counters.update(bytes_written=0)
+
+    def _key(self, session_key):
+        return f"{self.KEY_PREFIX}{session_key}"
+
+    def load(self, session_key):
+        record = self.cache.get(self._key(session_key))
+        self._count("hits" if record is not None else "misses")
+        return record if record is not None else empty_record()
+
+    def save(self, session_key, record):
+        self.cache.set(self._key(session_key), record, self.ttl)
+        self._count("writes")
+        self._count("bytes_written", _record_size(record))
+
+    def delete(self, session_key):
+        self.cache.delete(self._key(session_key))
+
+
+@lru_cache(maxsize=None)
+def get_memory_store():
+    """Return the process-wide memory store configured in settings."""
+    path = getattr(settings, "CHATBOT_MEMORY_STORE", DEFAULT_MEMORY_STORE)
+    return import_string(path)()
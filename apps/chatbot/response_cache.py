@@ -0,0 +1,208 @@
+"""Cache of chatbot replies to repeated questions.
+
+Replies are cached per *scope*: a fingerprint of the facts the answer
+depends on, not of who asked. For customers that is the statuses of their
+recent orders, for admins the order stats snapshot they were shown (see
+``views.build_context``). Customers in the same situation asking "how do
+refunds work" therefore share one entry, and a user's replies stop matching
+as soon as one of their orders changes status.
+
+Within a scope a question is looked up by its normalized text. With
+``CHATBOT_RESPONSE_CACHE_SIMILARITY`` set (e.g. ``0.92``) a miss also compares
+the question's embedding with the scope's last ``CHATBOT_RESPONSE_CACHE_SIZE``
+cached questions and reuses the reply of the closest one above that cosine
+similarity.
+
+Only opening questions are cached: once a conversation has history the
+reply depends on it, and very short questions ("why?", "and that one?")
+are follow-ups too. Replies that mention the asker (name, email, order
+ids) are not stored, since other users may receive them. Entries live in
+the shared cache ``CHATBOT_RESPONSE_CACHE`` (every worker sees them) and
+expire after ``CHATBOT_RESPONSE_CACHE_TTL`` seconds; the cache's own
+eviction bounds the total size.
+"""
+import hashlib
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\w+")
+
+# questions with fewer tokens are treated as follow-ups and not cached
+MIN_QUESTION_TOKENS = 3
+
+KEY_PREFIX = "chatbot:reply:"
+
+
+def normalize_question(text):
+    """Lowercase word tokens joined by spaces (punctuation and case ignored)."""
+    return " ".join(TOKEN_RE.findall((text or "").lower()))
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def scope_for(facts):
+    """Fingerprint of ``facts``, a tuple of strings the answer depends on."""
+    return _digest("\0".join(facts))
+
+
+@dataclass
+class CacheKey:
+    scope: str
+    question: str
+    # False for follow-ups, whose reply depends on the conversation
+    opening: bool = True
+    # the asker's name, email, order ids...: replies mentioning them are not shared
+    private: tuple = field(default=(), repr=False)
+    vector: object = field(default=None, repr=False)
+
+    @property
+    def cacheable(self):
+        return self.opening and len(self.question.split()) >= MIN_QUESTION_TOKENS
+
+    def shareable(self, reply):
+        """True if ``reply`` mentions nothing specific to the asker."""
+        text = reply.lower()
+        words = set(TOKEN_RE.findall(text))
+        # single words (usernames, order ids) must match whole words
+        return not any(p.lower() in (words if p.isalnum() else text) for p in self.private)
+
+    @property
+    def reply_key(self):
+        return f"{KEY_PREFIX}{self.scope}:{_digest(self.question)}"
+
+    @property
+    def index_key(self):
+        return f"{KEY_PREFIX}{self.scope}:questions"
+
+
+class ResponseCache:
+    """Replies stored in a Django cache, keyed by ``(scope, question)``.
+
+    With ``similarity`` set, each scope also keeps a list of its latest
+    ``max_questions`` questions and their embeddings to scan on a miss.
+    """
+
+    def __init__(self, cache, ttl, max_questions, similarity=None):
+        self.cache = cache
+        self.ttl = ttl
+        self.max_questions = max_questions
+        self.similarity = similarity
+        self._counters = {"hits": 0, "similar_hits": 0, "misses": 0, "writes": 0}
+        self._counter_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._counter_lock:
+            self._counters[name] += 1
+
+    def get(self, key):
+        """Reply cached for exactly ``key``'s question, else None."""
+        reply = self.cache.get(key.reply_key)
+        self._count("hits" if reply is not None else "misses")
+        return reply
+
+    def get_similar(self, key):
+        """Reply of the scope's question closest to ``key.vector`` if it is
+        at least ``similarity`` close, else None."""
+        if key.vector is None or not self.similarity:
+            return None
+        best, best_score = None, self.similarity
+        for question, vector in self.cache.get(key.index_key, ()):
+            score = _cosine(key.vector, vector)
+            if score >= best_score:
+                best, best_score = question, score
+        if best is None:
+            return None
+        reply = self.cache.get(CacheKey(key.scope, best).reply_key)
+        if reply is not None:
+            self._count("similar_hits")
+        return reply
+
+    def set(self, key, reply):
+        self.cache.set(key.reply_key, reply, self.ttl)
+        self._count("writes")
+        if self.similarity and key.vector is not None:
+            # read-modify-write: a concurrent store may drop one question
+            # from the index, which only costs a later similarity miss
+            questions = [q for q in self.cache.get(key.index_key, ()) if q[0] != key.question]
+            questions.append((key.question, list(key.vector)))
+            self.cache.set(key.index_key, questions[-self.max_questions:], self.ttl)
+
+    def stats(self):
+        """Traffic of this process (the shared cache cannot be enumerated)."""
+        with self._counter_lock:
+            return dict(self._counters, alias=getattr(settings, "CHATBOT_RESPONSE_CACHE", "default"))
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = (sum(x * x for x in a) ** 0.5) * (sum(y * y for y in b) ** 0.5)
+    return dot / norm if norm else 0.0
+
+
+@lru_cache(maxsize=None)
+def get_response_cache():
+    return ResponseCache(
+        cache=caches[getattr(settings, "CHATBOT_RESPONSE_CACHE", "default")],
+        ttl=getattr(settings, "CHATBOT_RESPONSE_CACHE_TTL", 600),
+        max_questions=getattr(settings, "CHATBOT_RESPONSE_CACHE_SIZE", 200),
+        similarity=getattr(settings, "CHATBOT_RESPONSE_CACHE_SIMILARITY", 0) or None,
+    )
+
+
+def make_key(facts, user_msg, has_history=False, private=()):
+    """Key of ``user_msg`` given the ``facts`` its answer depends on; not
+    cacheable when the conversation ``has_history``. Replies containing one
+    of the ``private`` strings are not stored."""
+    return CacheKey(scope_for(facts), normalize_question(user_msg), opening=not has_history, private=private)
+
+
+def lookup(key, embed=None):
+    """Cached reply for ``key`` or None.
+
+    ``embed(text) -> vector`` enables the similarity lookup on an exact miss;
+    the vector is kept on ``key`` so ``store`` doesn't embed again.
+    """
+    if not key.cacheable:
+        return None
+    response_cache = get_response_cache()
+    reply = response_cache.get(key)
+    if reply is None and embed is not None and response_cache.similarity:
+        try:
+            key.vector = embed(key.question)
+        except Exception:
+            logger.exception("Question embedding failed")
+            return None
+        reply = response_cache.get_similar(key)
+    return reply
+
+
+async def alookup(key, aembed=None):
+    """``lookup`` for async views."""
+    if not key.cacheable:
+        return None
+    response_cache = get_response_cache()
+    reply = await sync_to_async(response_cache.get)(key)
+    if reply is None and aembed is not None and response_cache.similarity:
+        try:
+            key.vector = await aembed(key.question)
+        except Exception:
+            logger.exception("Question embedding failed")
+            return None
+        reply = await sync_to_async(response_cache.get_similar)(key)
+    return reply
+
+
+def store(key, reply):
+    if key.cacheable and reply and key.shareable(reply):
+        get_response_cache().set(key, reply)
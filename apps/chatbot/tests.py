@@ -1,3 +1,94 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, override_settings
 
-# Create your tests here.
+from . import response_cache, views
+from .memory import get_memory_store
+
+
+def fold(summary, messages):
+    """Stand-in for the LLM summarizer: keeps every folded message."""
+    return " | ".join([summary] * bool(summary) + [m["content"] for m in messages])
+
+
+@override_settings(
+    CHATBOT_MEMORY_STORE="apps.chatbot.memory.LocalMemoryStore",
+    CHATBOT_MEMORY_MAX_MESSAGES=20,
+    CHATBOT_MEMORY_MAX_TOKENS=2000,
+    CHATBOT_HISTORY_TOKENS=1500,
+)
+class ConversationMemoryTests(SimpleTestCase):
+    KEY = "session"
+
+    def setUp(self):
+        get_memory_store.cache_clear()
+        self.addCleanup(get_memory_store.cache_clear)
+
+    def turn(self, i):
+        summary, old = views._save_turn(self.KEY, f"question {i}", f"answer {i}")
+        if old:
+            views._save_summary(self.KEY, summary, old, fold(summary, old))
+
+    def test_message_cap_reached_before_token_budget_is_summarized(self):
+        for i in range(40):
+            self.turn(i)
+        record = get_memory_store().load(self.KEY)
+        self.assertLessEqual(len(record["messages"]), 20)
+        self.assertEqual(get_memory_store().stats()["trimmed_messages"], 0)
+        kept = record["summary"] + " " + " ".join(m["content"] for m in record["messages"])
+        for i in range(40):
+            self.assertIn(f"question {i} ", kept + " ")
+
+    def test_turn_saved_during_summary_is_kept(self):
+        for i in range(9):
+            self.turn(i)
+        summary, old = views._save_turn(self.KEY, "question 9", "answer 9")
+        self.assertTrue(old)
+        # the next message lands while the summary is being written
+        views._save_turn(self.KEY, "question 10", "answer 10")
+        views._save_summary(self.KEY, summary, old, fold(summary, old))
+        record = get_memory_store().load(self.KEY)
+        self.assertEqual(record["messages"][-1]["content"], "answer 10")
+        self.assertIn("question 0", record["summary"])
+        self.assertNotIn(old[0], record["messages"])
+
+    def test_stale_summary_is_not_saved(self):
+        for i in range(9):
+            self.turn(i)
+        summary, old = views._save_turn(self.KEY, "question 9", "answer 9")
+        views._save_summary(self.KEY, summary, old, "first")
+        views._save_summary(self.KEY, summary, old, "second")
+        self.assertEqual(get_memory_store().load(self.KEY)["summary"], "first")
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    CHATBOT_RESPONSE_CACHE="default",
+)
+class ResponseCacheTests(SimpleTestCase):
+    QUESTION = "How do refunds work?"
+
+    def setUp(self):
+        response_cache.get_response_cache.cache_clear()
+        self.addCleanup(response_cache.get_response_cache.cache_clear)
+
+    def test_users_in_the_same_situation_share_replies(self):
+        key = response_cache.make_key(("customer", "Delivered"), self.QUESTION, private=("alice",))
+        response_cache.store(key, "Refunds take 5-7 days.")
+        other = response_cache.make_key(("customer", "Delivered"), "how do REFUNDS work", private=("bob",))
+        self.assertEqual(response_cache.lookup(other), "Refunds take 5-7 days.")
+        changed = response_cache.make_key(("customer", "Cancelled"), self.QUESTION)
+        self.assertIsNone(response_cache.lookup(changed))
+
+    def test_follow_ups_are_not_cached(self):
+        key = response_cache.make_key(("customer",), "tell me more about it", has_history=True)
+        response_cache.store(key, "It is a thriller.")
+        self.assertIsNone(response_cache.lookup(response_cache.make_key(("customer",), "tell me more about it")))
+        self.assertFalse(response_cache.make_key(("customer",), "why?").cacheable)
+
+    def test_replies_mentioning_the_asker_are_not_stored(self):
+        key = response_cache.make_key(("customer", "Delivered"), self.QUESTION, private=("Alice Smith", "12"))
+        response_cache.store(key, "Alice Smith, order 12 can be refunded.")
+        self.assertIsNone(response_cache.lookup(key))
+        response_cache.store(key, "Refunds for 2 books take 12-15 days.")
+        self.assertIsNone(response_cache.lookup(key))
+        response_cache.store(key, "Refunds of order 120 take 5-7 days.")
+        self.assertIsNotNone(response_cache.lookup(key))
@@ -0,0 +1,47 @@
+"""Token counting for chat prompts.
+
+Uses ``tiktoken`` with the encoding of ``CHATBOT_MODEL`` when it is installed
+and its encoding files can be loaded (they are downloaded on first use);
+otherwise falls back to ~4 characters per token, which is close enough for
+budgeting English text.
+"""
+import logging
+from functools import lru_cache
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# tokens the API adds around every chat message (role, separators)
+MESSAGE_OVERHEAD = 4
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    model = getattr(settings, "CHATBOT_MODEL", "gpt-4o")
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as exc:
+        logger.warning("tiktoken encoding unavailable, estimating tokens: %s", exc)
+        return None
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages):
+    """Prompt tokens of ``[{"role": ..., "content": ...}, ...]``."""
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages)
@@ -6,4 +6,6 @@ app_name = "chatbot"
 urlpatterns = [
     path("", views.chat_page, name="chat_page"),
     path("api/", views.chat_api, name="chat_api"),
+    path("stream/", views.chat_stream, name="chat_stream"),
+    path("memory-stats/", views.memory_stats, name="memory_stats"),
 ]
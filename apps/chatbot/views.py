@@ -1,50 +1,45 @@
 # apps/chatbot/views.py
-import os
+import json
+import logging
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 
-from langchain_openai import ChatOpenAI
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import ChatPromptTemplate
-
 from apps.orders.models import Order
+from apps.orders.stats import get_order_stats
 
-# Create a dict in memory (not persisted)
-SESSION_MEMORIES = {}
+# LangChain/OpenAI are imported on the first chat, not when URLs load
+from . import history, llm, response_cache
+from .memory import AI, HUMAN, get_memory_store, message
+from .tokens import count_message_tokens
 
-def get_chat_memory(session_key):
-    if session_key not in SESSION_MEMORIES:
-        SESSION_MEMORIES[session_key] = ConversationBufferMemory(return_messages=True)
-    return SESSION_MEMORIES[session_key]
+logger = logging.getLogger(__name__)
 
-@login_required
-def chat_page(request):
-    """Render the chatbot page (floating widget UI)."""
-    return render(request, "chatbot/chat.html")
+def _memory_key(request, user):
+    # logged-in users always have a session; fall back to the user just in case
+    return request.session.session_key or f"user-{user.pk}"
 
-@login_required
-def chat_api(request):
-    """AJAX endpoint for sending/receiving chat messages."""
-    if request.method != "POST":
-        return JsonResponse({"error": "Invalid request"}, status=400)
-
-    user = request.user
-    user_msg = request.POST.get("message", "").strip()
-    if not user_msg:
-        return JsonResponse({"error": "Empty message"}, status=400)
-
-    # fetch memory for this user’s session
-    memory = get_chat_memory(request.session.session_key)
+def build_context(user):
+    """System prompt for ``user``: order stats for admins, their own recent
+    orders for customers (one query).
 
+    Returns ``(context, facts, private)``: the prompt, the facts a reply
+    depends on (the response cache scope) and the user-specific strings a
+    reply must not contain to be shared with other users.
+    """
+    private = tuple(filter(None, (user.get_full_name(), user.username, user.email)))
     # ADMIN CONTEXT
     if user.is_superuser or user.email == "t.shakthi@gmail.com":
-        qs = Order.objects.all()
-        total = qs.count()
-        cancelled = qs.filter(status=Order.STATUS_CANCELLED).count()
-        refunded = qs.filter(status=Order.STATUS_REFUNDED).count()
-        inprogress = qs.filter(status=Order.STATUS_IN_PROGRESS).count()
-        delivered = qs.filter(status=Order.STATUS_DELIVERED).count()
+        # one cached aggregate query instead of a COUNT per status
+        stats = get_order_stats()
+        by_status = stats["by_status"]
+        periods = "\n".join(
+            f"        Last {label}: {p['orders']} orders, revenue ₹{p['revenue']}."
+            for label, p in stats["periods"].items()
+        )
 
         context = f"""
         You are Taylor, a helpful assistant for the **admin**.
@@ -57,14 +52,19 @@ def chat_api(request):
         - Politely refuse if asked to modify database records.
         - You may summarize counts, totals, or high-level stats.
 
-        Current stats:
-        Total Orders: {total}, In Progress: {inprogress}, Delivered: {delivered},
-        Cancelled: {cancelled}, Refunded: {refunded}.
+        Current stats (as of {stats['computed_at']:%Y-%m-%d %H:%M} UTC):
+        Total Orders: {stats['total']}, In Progress: {by_status[Order.STATUS_IN_PROGRESS]},
+        Delivered: {by_status[Order.STATUS_DELIVERED]}, Cancelled: {by_status[Order.STATUS_CANCELLED]},
+        Refunded: {by_status[Order.STATUS_REFUNDED]}, Returned: {by_status[Order.STATUS_RETURNED]},
+        Awaiting Verification: {by_status[Order.STATUS_AWAITING_VERIFICATION]}.
+        Revenue (in progress + delivered): ₹{stats['revenue']}.
+{periods}
         """
+        facts = ("admin", stats["computed_at"].isoformat())
 
     # CUSTOMER CONTEXT
     else:
-        qs = Order.objects.filter(user=user).order_by("-created_at")[:5]
+        qs = list(Order.objects.filter(user=user).order_by("-created_at")[:5])
 
         context = f"""
         You are Taylor, a friendly assistant for a **customer**.
@@ -80,24 +80,185 @@ def chat_api(request):
           or contact support — you cannot modify records.
         - Always respond with empathy if orders are cancelled or refunded.
 
-        The user has {qs.count()} recent orders.
+        The user has {len(qs)} recent orders.
         """
         for o in qs:
             context += f"- Order {o.id} — Status: {o.status}, Amount: {o.total_amount}\n"
+        facts = ("customer", *(o.status for o in qs))
+        private += tuple(str(o.id) for o in qs)
+    return context, facts, private
+
+def _load_history(memory_key):
+    """``(summary, recent)``: the history the next prompt carries, i.e. the
+    stored summary plus the recent turns that fit the token budget."""
+    return history.window(get_memory_store().load(memory_key))
+
+def _prepare_prompt(context, user_msg, summary, recent):
+    """Build the prompt messages for ``user_msg``; returns
+    ``(messages, prompt_tokens)``."""
+    messages = llm.build_messages(context, user_msg, summary, recent)
+    prompt_tokens = count_message_tokens({"content": m.content} for m in messages)
+    return messages, prompt_tokens
+
+def _save_turn(memory_key, user_msg, reply):
+    """Store the turn; returns ``(summary, old)``: the stored summary and the
+    old messages that should now be folded into it.
+
+    The record is re-read rather than reusing the one the prompt was built
+    from, so a summary saved meanwhile is kept. The overflow is split off
+    before the store applies its caps, so trimmed messages still get
+    summarized.
+    """
+    store = get_memory_store()
+    record = store.load(memory_key)
+    record["messages"] += [message(HUMAN, user_msg), message(AI, reply)]
+    old, _ = history.split_overflow(record, max_messages=store.max_messages)
+    store.put(memory_key, record)
+    return record.get("summary", ""), old
 
-    # LangChain LLM
-    llm = ChatOpenAI(model="gpt-4o", openai_api_key=os.environ.get("OPENAI_API_KEY"))
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", context),
-        ("human", "{input}")
-    ])
+def _save_summary(memory_key, previous, old, summary):
+    """Replace what is left of the ``old`` leading messages with ``summary``.
+
+    The record is re-read, since turns may have been saved while the
+    summary was written. Nothing changes if the summary is no longer
+    ``previous`` (another request folded these turns already) or none of
+    ``old`` still leads the conversation.
+    """
+    store = get_memory_store()
+    record = store.load(memory_key)
+    if record.get("summary", "") != previous:
+        return
+    messages = record["messages"]
+    # the store's caps may have trimmed the start of ``old`` already
+    for start in range(len(old)):
+        rest = old[start:]
+        if messages[:len(rest)] == rest:
+            record["messages"] = messages[len(rest):]
+            record["summary"] = summary
+            store.put(memory_key, record)
+            return
+
+def _log_prompt(user, estimated, usage):
+    """Log the prompt size; returns the API's count when it reported one."""
+    actual = (usage or {}).get("input_tokens")
+    logger.info("chat prompt for user %s: %s tokens (estimated %s)", user.pk, actual or "?", estimated)
+    return actual or estimated
+
+@login_required
+def chat_page(request):
+    """Render the chatbot page (floating widget UI)."""
+    return render(request, "chatbot/chat.html")
+
+@login_required
+def chat_api(request):
+    """AJAX endpoint for sending/receiving chat messages."""
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request"}, status=400)
+
+    user = request.user
+    user_msg = request.POST.get("message", "").strip()
+    if not user_msg:
+        return JsonResponse({"error": "Empty message"}, status=400)
+
+    memory_key = _memory_key(request, user)
+    context, facts, private = build_context(user)
+    summary, recent = _load_history(memory_key)
+    cache_key = response_cache.make_key(facts, user_msg, bool(summary or recent), private)
+    reply = response_cache.lookup(cache_key, embed=llm.embed)
+    cached = reply is not None
+    if cached:
+        prompt_tokens = 0
+    else:
+        messages, estimated = _prepare_prompt(context, user_msg, summary, recent)
+        resp = llm.get_chat_model().invoke(messages)
+        reply = resp.content
+        prompt_tokens = _log_prompt(user, estimated, resp.usage_metadata)
+        response_cache.store(cache_key, reply)
+
+    # add to this session's conversation memory, summarizing old turns
+    summary, old = _save_turn(memory_key, user_msg, reply)
+    if old:
+        try:
+            _save_summary(memory_key, summary, old, llm.summarize(summary, old))
+        except Exception:
+            # the store's caps still bound the conversation
+            logger.exception("Conversation summary failed")
+
+    return JsonResponse({"reply": reply, "prompt_tokens": prompt_tokens, "cached": cached})
+
+def _sse(data, event=None):
+    """One Server-Sent Events frame carrying ``data`` as JSON."""
+    frame = f"event: {event}\n" if event else ""
+    return f"{frame}data: {json.dumps(data)}\n\n"
+
+@login_required
+async def chat_stream(request):
+    """Async chat endpoint streaming the reply as Server-Sent Events.
+
+    Each token arrives as a ``data: {"token": ...}`` frame, followed by a
+    ``done`` event with the full reply and prompt token count (or an
+    ``error`` event). Served under ASGI the request only holds the event
+    loop while waiting on the LLM, and the process-wide chat model keeps its
+    HTTP connections open between requests.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request"}, status=400)
+
+    user = await request.auser()
+    user_msg = request.POST.get("message", "").strip()
+    if not user_msg:
+        return JsonResponse({"error": "Empty message"}, status=400)
 
-    chain = prompt | llm
-    resp = chain.invoke({"input": user_msg})
+    memory_key = _memory_key(request, user)
+    context, facts, private = await sync_to_async(build_context)(user)
+    summary, recent = await sync_to_async(_load_history)(memory_key)
+    cache_key = response_cache.make_key(facts, user_msg, bool(summary or recent), private)
+    cached_reply = await response_cache.alookup(cache_key, aembed=llm.aembed)
+    if cached_reply is None:
+        # also imports the LLM stack on first use; keep that off the event loop
+        messages, estimated = await sync_to_async(_prepare_prompt)(context, user_msg, summary, recent)
 
-    # add to memory
-    memory.save_context({"input": user_msg}, {"output": resp.content})
+    async def events():
+        if cached_reply is not None:
+            reply, prompt_tokens = cached_reply, 0
+            yield _sse({"token": reply})
+        else:
+            parts, usage = [], None
+            try:
+                async for chunk in llm.get_async_chat_model().astream(messages):
+                    usage = chunk.usage_metadata or usage
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield _sse({"token": chunk.content})
+            except Exception:
+                logger.exception("Chat stream failed")
+                yield _sse({"error": "Sorry, something went wrong. Please try again."}, event="error")
+                return
+            reply = "".join(parts)
+            prompt_tokens = _log_prompt(user, estimated, usage)
+            await sync_to_async(response_cache.store)(cache_key, reply)
+        summary, old = await sync_to_async(_save_turn)(memory_key, user_msg, reply)
+        yield _sse(
+            {"reply": reply, "prompt_tokens": prompt_tokens, "cached": cached_reply is not None}, event="done"
+        )
 
-    return JsonResponse({"reply": resp.content})
+        # the client has its reply; fold old turns into the summary
+        if old:
+            try:
+                folded = await llm.asummarize(summary, old)
+                await sync_to_async(_save_summary)(memory_key, summary, old, folded)
+            except Exception:
+                logger.exception("Conversation summary failed")
 
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # don't let nginx buffer the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
 
+@staff_member_required
+def memory_stats(request):
+    """Conversation memory and reply cache usage as seen by this worker."""
+    stats = get_memory_store().stats()
+    stats["response_cache"] = response_cache.get_response_cache().stats()
+    return JsonResponse(stats)
@@ -1,27 +1,84 @@
 from django.contrib import admin
-from .models import Cart, CartItem, Order, OrderItem
+from . import inventory
+from .models import CENT, Cart, CartItem, Order, OrderItem, OutboxMessage, StockReservation, StockShard
+
+
+class LineTotalMixin:
+    """Admin column for the ``line_total`` annotation of item querysets."""
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_line_total()
+
+    @admin.display(description="Line total", ordering="line_total")
+    def line_total(self, obj):
+        return obj.line_total.quantize(CENT)
 
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ("id", "user", "created_at", "updated_at")
+    list_display = ("id", "user", "items_total", "created_at", "updated_at")
+    list_select_related = ("user",)
     search_fields = ("user__username", "user__email")
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_total()
+
+    @admin.display(description="Total", ordering="items_total")
+    def items_total(self, obj):
+        return obj.items_total.quantize(CENT)
+
 
 @admin.register(CartItem)
-class CartItemAdmin(admin.ModelAdmin):
-    list_display = ("id", "cart", "book", "quantity", "price_at_add", "added_at")
+class CartItemAdmin(LineTotalMixin, admin.ModelAdmin):
+    list_display = ("id", "cart", "book", "quantity", "price_at_add", "line_total", "added_at")
+    list_select_related = ("cart__user", "book")
     search_fields = ("cart__user__username", "book__title")
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ("id", "user", "status", "total_amount", "created_at", "is_verified")
+    list_display = ("id", "user", "status", "total_amount", "item_count", "created_at", "is_verified")
     list_filter = ("status", "is_verified", "created_at")
+    list_select_related = ("user",)
     search_fields = ("user__username", "user__email", "id")
 
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ("id", "order", "book", "quantity", "price", "created_at")
+class OrderItemAdmin(LineTotalMixin, admin.ModelAdmin):
+    list_display = ("id", "order", "book", "quantity", "price", "line_total", "created_at")
+    list_select_related = ("order__user", "book")
     search_fields = ("order__id", "book__title")
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ("id", "book", "user", "quantity", "shard", "status", "expires_at", "order")
+    list_filter = ("status",)
+    search_fields = ("book__title", "user__username")
+
+
+@admin.register(StockShard)
+class StockShardAdmin(admin.ModelAdmin):
+    list_display = ("id", "book", "index", "stock")
+    search_fields = ("book__title",)
+
+    # keep Book.stock (shown on the catalog) in step with edited shards
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        inventory.sync_sharded_stock([obj.book_id])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        inventory.sync_sharded_stock([obj.book_id])
+
+    def delete_queryset(self, request, queryset):
+        book_ids = list(queryset.values_list("book_id", flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        inventory.sync_sharded_stock(book_ids)
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "attempts", "available_at", "processed_at")
+    list_filter = ("status", "kind")
+    readonly_fields = ("created_at", "processed_at", "last_error")
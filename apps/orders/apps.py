@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class OrdersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.orders"
+
+    def ready(self):
+        # Import signals so cached cart counts follow CartItem changes
+        import apps.orders.signals  # noqa
@@ -0,0 +1,38 @@
+"""Per-user cached cart badge counts.
+
+The navbar shows the number of items in the user's cart on every page. The
+count is cached per user and dropped whenever a ``CartItem`` is saved or
+deleted (see ``signals.py``). That drop only reaches other processes through
+a shared cache; with the local-memory cache each process keeps its own
+count, so it is only trusted for ``LOCAL_CART_COUNT_TIMEOUT`` seconds.
+"""
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+CART_COUNT_TIMEOUT = 24 * 60 * 60
+LOCAL_CART_COUNT_TIMEOUT = 30
+
+
+def cart_count_key(user_id) -> str:
+    return f"orders:cart_count:{user_id}"
+
+
+def cart_count_timeout() -> int:
+    if isinstance(caches["default"], LocMemCache):
+        return LOCAL_CART_COUNT_TIMEOUT
+    return CART_COUNT_TIMEOUT
+
+
+def get_cart_count(user_id) -> int:
+    key = cart_count_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        from .models import CartItem
+
+        count = CartItem.objects.filter(cart__user_id=user_id).count()
+        cache.set(key, count, cart_count_timeout())
+    return count
+
+
+def invalidate_cart_count(user_id):
+    cache.delete(cart_count_key(user_id))
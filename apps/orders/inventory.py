@@ -0,0 +1,315 @@
+"""Stock reservations.
+
+Checkout reserves stock before it creates the order. Reserving is one short
+transaction of conditional ``UPDATE`` statements plus a ledger insert
+(``StockReservation``), so book rows are locked only for the length of those
+statements rather than for the whole checkout. The order is then written in
+its own transaction and the reservations are committed against it; if that
+fails the stock is released again, and holds abandoned by a crashed request
+are returned by ``release_expired`` once they expire (the ``worker`` process
+runs it between outbox batches, see ``process_outbox``).
+
+Stock changes bump the stock version (``apps.books.cache``), not the catalog
+version: cached pages show stock, counts and search results don't.
+
+Hot books can be sharded (``shard_stock``): their stock is split over
+several ``StockShard`` rows and each checkout decrements one of them, picked
+at random, so concurrent buyers rarely wait on the same row. ``Book.stock``
+of a sharded book is only a periodically synced copy of the shard total:
+change it with ``set_stock`` (a plain ``Book.stock`` write would be
+overwritten by the next ``sync_sharded_stock``) and check quantities against
+``StockShard.objects.available``.
+"""
+import random
+from collections import defaultdict
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from apps.books.cache import bump_stock_version
+from apps.books.models import Book
+
+from .models import StockReservation, StockShard
+
+# books per conditional stock UPDATE statement
+STOCK_UPDATE_BATCH = 200
+
+
+class InsufficientStock(Exception):
+    """A book does not have enough stock for the requested quantity."""
+
+    def __init__(self, book_id):
+        super().__init__(f"Insufficient stock for book {book_id}")
+        self.book_id = book_id
+
+
+def reservation_ttl() -> timedelta:
+    return timedelta(seconds=getattr(settings, "ORDERS_RESERVATION_TTL", 600))
+
+
+def _update_books(quantities, sign):
+    """Add ``sign * quantity`` to each book's stock, in batches.
+
+    Decrements are conditional (``stock >= quantity``); returns the number of
+    books updated. ``updated_at`` is bumped so conditional GETs on the book
+    pages see the change.
+    """
+    updated = 0
+    items = list(quantities.items())
+    for start in range(0, len(items), STOCK_UPDATE_BATCH):
+        batch = items[start:start + STOCK_UPDATE_BATCH]
+        if sign < 0:
+            condition = reduce(or_, (Q(id=book_id, stock__gte=qty) for book_id, qty in batch))
+        else:
+            condition = Q(id__in=[book_id for book_id, _ in batch])
+        updated += Book.objects.filter(condition).update(
+            stock=Case(*(When(id=book_id, then=F("stock") + sign * qty) for book_id, qty in batch)),
+            updated_at=Now(),
+        )
+    return updated
+
+
+def decrement_stock(quantities):
+    """Take ``{book_id: quantity}`` out of ``Book.stock``.
+
+    Runs ``UPDATE ... SET stock = stock - n WHERE id = .. AND stock >= n`` and
+    returns how many books were updated; a book whose stock is too low is
+    left untouched (and not counted).
+    """
+    return _update_books(quantities, -1)
+
+
+def increment_stock(quantities):
+    return _update_books(quantities, 1)
+
+
+def _sold_out(book_ids):
+    """True if one of ``book_ids`` has no stock left."""
+    return Book.objects.filter(id__in=list(book_ids), stock__lte=0).exists()
+
+
+def _back_in_stock(quantities):
+    """True if a book just incremented by ``{book_id: quantity}`` was out of
+    stock before the increment."""
+    return Book.objects.filter(
+        reduce(or_, (Q(id=book_id, stock__gt=0, stock__lte=qty) for book_id, qty in quantities.items()))
+    ).exists()
+
+
+def _take_from_shards(book_id, quantity):
+    """Take ``quantity`` from a sharded book; returns ``[(index, qty), ...]``
+    or ``None`` when the shards don't hold enough in total."""
+    shards = list(StockShard.objects.filter(book_id=book_id, stock__gte=quantity).values_list("index", flat=True))
+    random.shuffle(shards)
+    for index in shards:
+        took = StockShard.objects.filter(book_id=book_id, index=index, stock__gte=quantity).update(
+            stock=F("stock") - quantity
+        )
+        if took:
+            return [(index, quantity)]
+
+    # no single shard is big enough: lock them all and take a piece of each
+    pieces, remaining = [], quantity
+    for shard in StockShard.objects.select_for_update().filter(book_id=book_id).order_by("index"):
+        take = min(max(shard.stock, 0), remaining)
+        if take:
+            pieces.append((shard.index, take))
+            remaining -= take
+        if not remaining:
+            break
+    if remaining:
+        return None
+    for index, take in pieces:
+        StockShard.objects.filter(book_id=book_id, index=index).update(stock=F("stock") - take)
+    return pieces
+
+
+def reserve(user, quantities, ttl=None):
+    """Hold ``{book_id: quantity}`` for ``user``; all or nothing.
+
+    Returns the created ``StockReservation`` rows. Raises ``InsufficientStock``
+    (with nothing held) when any book is short.
+    """
+    expires_at = timezone.now() + (ttl or reservation_ttl())
+    sharded = set(
+        StockShard.objects.filter(book_id__in=quantities).values_list("book_id", flat=True).distinct()
+    )
+    plain = {book_id: qty for book_id, qty in quantities.items() if book_id not in sharded}
+
+    rows = []
+    with transaction.atomic():
+        if plain and decrement_stock(plain) != len(plain):
+            # the UPDATE is rolled back; find a book that was short to report it
+            short = Book.objects.filter(
+                reduce(or_, (Q(id=book_id, stock__lt=qty) for book_id, qty in plain.items()))
+            ).values_list("id", flat=True).first()
+            raise InsufficientStock(short if short is not None else next(iter(plain)))
+        rows.extend(
+            StockReservation(book_id=book_id, user=user, quantity=qty, expires_at=expires_at)
+            for book_id, qty in plain.items()
+        )
+        for book_id in sorted(sharded):
+            pieces = _take_from_shards(book_id, quantities[book_id])
+            if pieces is None:
+                raise InsufficientStock(book_id)
+            rows.extend(
+                StockReservation(book_id=book_id, user=user, quantity=qty, shard=index, expires_at=expires_at)
+                for index, qty in pieces
+            )
+        rows = StockReservation.objects.bulk_create(rows)
+    # the shard total of sharded books reaches Book.stock (and the pages)
+    # with the next sync_sharded_stock
+    if plain:
+        sold_out = _sold_out(plain)
+        transaction.on_commit(lambda: bump_stock_version(availability=sold_out))
+    return rows
+
+
+def commit(reservations, order):
+    """Mark held ``reservations`` as used by ``order``.
+
+    Returns ``False`` if any of them is no longer held (it expired and was
+    released), in which case the caller must not place the order.
+    """
+    ids = [r.pk for r in reservations]
+    committed = StockReservation.objects.filter(pk__in=ids, status=StockReservation.STATUS_HELD).update(
+        status=StockReservation.STATUS_COMMITTED, order=order
+    )
+    return committed == len(ids)
+
+
+def _release(queryset, skip_locked=False):
+    with transaction.atomic():
+        rows = list(
+            queryset.filter(status=StockReservation.STATUS_HELD)
+            .select_for_update(skip_locked=skip_locked)
+            .values_list("pk", "book_id", "shard", "quantity")
+        )
+        if not rows:
+            return 0
+        StockReservation.objects.filter(pk__in=[row[0] for row in rows]).update(
+            status=StockReservation.STATUS_RELEASED
+        )
+        plain, sharded = defaultdict(int), defaultdict(int)
+        for _, book_id, shard, qty in rows:
+            if shard is None:
+                plain[book_id] += qty
+            else:
+                sharded[(book_id, shard)] += qty
+        for (book_id, index), qty in sharded.items():
+            if StockShard.objects.filter(book_id=book_id, index=index).update(stock=F("stock") + qty):
+                continue
+            # resharded since the hold was taken: any shard will do, or the
+            # book itself once it is no longer sharded
+            shard = StockShard.objects.filter(book_id=book_id).order_by("index").values_list("index", flat=True).first()
+            if shard is None:
+                plain[book_id] += qty
+            else:
+                StockShard.objects.filter(book_id=book_id, index=shard).update(stock=F("stock") + qty)
+        if plain:
+            increment_stock(plain)
+            restocked = _back_in_stock(plain)
+            transaction.on_commit(lambda: bump_stock_version(availability=restocked))
+    return len(rows)
+
+
+def release(reservations):
+    """Give the stock of still-held ``reservations`` back."""
+    return _release(StockReservation.objects.filter(pk__in=[r.pk for r in reservations]))
+
+
+def release_expired(batch_size=500):
+    """Release every expired hold, ``batch_size`` rows per transaction.
+
+    Rows locked by a concurrent commit/release are skipped (on databases
+    that support it) and picked up by a later run.
+    """
+    released = 0
+    while True:
+        expired = StockReservation.objects.filter(
+            status=StockReservation.STATUS_HELD, expires_at__lt=timezone.now()
+        ).order_by("expires_at")
+        batch = _release(
+            StockReservation.objects.filter(pk__in=list(expired.values_list("pk", flat=True)[:batch_size])),
+            skip_locked=True,
+        )
+        released += batch
+        if batch < batch_size:
+            return released
+
+
+def sync_sharded_stock(book_ids=None):
+    """Refresh ``Book.stock`` of sharded books to the sum of their shards."""
+    shards = StockShard.objects.all()
+    if book_ids is not None:
+        shards = shards.filter(book_id__in=book_ids)
+    total = (
+        StockShard.objects.filter(book=OuterRef("pk"))
+        .values("book")
+        .annotate(total=Sum("stock"))
+        .values("total")
+    )
+    changed = list(
+        Book.objects.filter(id__in=shards.values("book_id"))
+        .annotate(total=Subquery(total))
+        .exclude(stock=F("total"))
+        .values_list("id", "stock", "total")
+    )
+    if not changed:
+        return 0
+    updated = Book.objects.filter(id__in=[book_id for book_id, _, _ in changed]).update(
+        stock=Subquery(total), updated_at=Now()
+    )
+    flipped = any((stock <= 0) != (new <= 0) for _, stock, new in changed)
+    transaction.on_commit(lambda: bump_stock_version(availability=flipped))
+    return updated
+
+
+def shard_stock(book_id, shards, total=None):
+    """Spread a book's stock over ``shards`` rows (``shards <= 1`` un-shards it).
+
+    Existing shards are merged first, so this can also rebalance a book.
+    ``total`` replaces the current stock (a restock or correction). Held
+    reservations are moved to the new shards (or to ``Book.stock``) so
+    releasing them still returns their stock.
+    """
+    with transaction.atomic():
+        book = Book.objects.select_for_update().get(pk=book_id)
+        existing = list(StockShard.objects.select_for_update().filter(book=book))
+        if total is None:
+            total = sum(s.stock for s in existing) if existing else book.stock
+        StockShard.objects.filter(book=book).delete()
+        if shards > 1:
+            base, extra = divmod(max(total, 0), shards)
+            StockShard.objects.bulk_create([
+                StockShard(book=book, index=i, stock=base + (1 if i < extra else 0))
+                for i in range(shards)
+            ])
+        held = StockReservation.objects.filter(book=book, status=StockReservation.STATUS_HELD, shard__isnull=False)
+        if shards > 1:
+            held.filter(shard__gte=shards).update(shard=F("shard") % shards)
+        else:
+            held.update(shard=None)
+        Book.objects.filter(pk=book.pk).update(stock=total, updated_at=Now())
+    transaction.on_commit(lambda: bump_stock_version(availability=True))
+    return total
+
+
+def set_stock(book_id, stock):
+    """Set a book's available stock to ``stock``.
+
+    A sharded book's stock is spread over the same number of shards again;
+    other books just get ``Book.stock`` updated.
+    """
+    shards = StockShard.objects.filter(book_id=book_id).count()
+    if shards:
+        return shard_stock(book_id, shards, total=stock)
+    Book.objects.filter(pk=book_id).update(stock=stock, updated_at=Now())
+    transaction.on_commit(lambda: bump_stock_version(availability=True))
+    return stock
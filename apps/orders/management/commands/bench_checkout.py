@@ -0,0 +1,103 @@
+import statistics
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.books.models import Book
+from apps.orders import inventory
+from apps.orders.models import Cart, CartItem, Order, StockReservation
+from apps.orders.services import place_order
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark concurrent checkouts of a single hot book. Creates a "
+        "throwaway book and buyers, places one order per buyer from several "
+        "threads, reports throughput and latency, then deletes everything. "
+        "Use a PostgreSQL database: SQLite serializes all writers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--buyers", type=int, default=200)
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument(
+            "--shards", type=int, action="append",
+            help="Shard counts to compare (repeatable); 0 means unsharded. Default: 0 and 8.",
+        )
+
+    def handle(self, *args, **options):
+        for shards in options["shards"] or [0, 8]:
+            self._run(options["buyers"], options["threads"], shards)
+
+    def _run(self, buyers, threads, shards):
+        tag = uuid.uuid4().hex[:8]
+        User = get_user_model()
+        book = Book.objects.create(title=f"bench-hot-{tag}", price=Decimal("1.00"), stock=buyers)
+        if shards > 1:
+            inventory.shard_stock(book.pk, shards)
+        users = User.objects.bulk_create(
+            [User(username=f"bench-{tag}-{i}") for i in range(buyers)]
+        )
+        carts = Cart.objects.bulk_create([Cart(user=u) for u in users])
+        CartItem.objects.bulk_create(
+            [CartItem(cart=c, book=book, quantity=1, price_at_add=book.price) for c in carts]
+        )
+
+        latencies, failures = [], []
+        lock = threading.Lock()
+        queue = list(users)
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        if not queue:
+                            return
+                        user = queue.pop()
+                    start = time.perf_counter()
+                    try:
+                        place_order(user)
+                    except Exception as exc:
+                        with lock:
+                            failures.append(exc)
+                        continue
+                    with lock:
+                        latencies.append(time.perf_counter() - start)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        if shards > 1:
+            inventory.sync_sharded_stock([book.pk])
+        remaining = Book.objects.get(pk=book.pk).stock
+        label = f"{shards} shards" if shards > 1 else "unsharded"
+        self.stdout.write(
+            f"{label}: {len(latencies)} orders in {elapsed:.2f}s "
+            f"({len(latencies) / elapsed:.1f} orders/s), {len(failures)} failed, "
+            f"stock left {remaining}"
+        )
+        if latencies:
+            latencies.sort()
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(
+                f"  latency p50 {statistics.median(latencies) * 1000:.1f}ms, p99 {p99 * 1000:.1f}ms"
+            )
+        if failures:
+            self.stdout.write(f"  first failure: {failures[0]!r}")
+
+        StockReservation.objects.filter(book=book).delete()
+        Order.objects.filter(user__in=users).delete()
+        User.objects.filter(pk__in=[u.pk for u in users]).delete()
+        book.delete()
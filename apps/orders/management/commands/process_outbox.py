@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.orders import inventory, outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver queued order side effects (emails, webhooks) from the outbox, "
+        "retrying failures with backoff. Runs until stopped unless --once is given. "
+        "Every --release-every seconds it also returns the stock of expired "
+        "checkout reservations, syncs sharded stock (see release_reservations) "
+        "and deletes outbox rows older than ORDERS_OUTBOX_RETENTION_DAYS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--sleep", type=float, default=2.0, help="Seconds to wait when the outbox is empty.")
+        parser.add_argument("--once", action="store_true", help="Drain the due messages and exit.")
+        parser.add_argument(
+            "--release-every", type=float, default=60.0,
+            help="Seconds between expired-reservation and outbox cleanup sweeps; 0 disables them.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        release_every = options["release_every"]
+        total_sent = total_failed = 0
+        next_release = time.monotonic()
+        try:
+            while True:
+                if release_every and time.monotonic() >= next_release:
+                    self._sweep()
+                    next_release = time.monotonic() + release_every
+                sent, failed = outbox.process_batch(batch_size)
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    self.stdout.write(f"Sent {sent}, failed {failed}.")
+                if sent + failed < batch_size:
+                    if options["once"]:
+                        break
+                    time.sleep(options["sleep"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Done: {total_sent} sent, {total_failed} failed.")
+
+    def _sweep(self):
+        released = inventory.release_expired()
+        synced = inventory.sync_sharded_stock()
+        if released or synced:
+            self.stdout.write(f"Released {released} expired reservation(s); synced {synced} sharded book(s).")
+        pruned = outbox.prune()
+        if pruned:
+            self.stdout.write(f"Deleted {pruned} processed outbox message(s).")
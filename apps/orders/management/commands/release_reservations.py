@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from apps.orders import inventory
+
+
+class Command(BaseCommand):
+    help = (
+        "Return the stock of expired checkout reservations and refresh the "
+        "stock shown for sharded books. The process_outbox worker already does "
+        "this every minute; run it by hand or from cron when no worker is running."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        released = inventory.release_expired(batch_size=options["batch_size"])
+        synced = inventory.sync_sharded_stock()
+        self.stdout.write(f"Released {released} expired reservation(s); synced {synced} sharded book(s).")
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+# keep in sync with Order.SUMMARY_TITLES
+SUMMARY_TITLES = 3
+BATCH_SIZE = 1000
+
+
+def backfill_item_summary(apps, schema_editor):
+    Order = apps.get_model("orders", "Order")
+    OrderItem = apps.get_model("orders", "OrderItem")
+    summaries = {}
+    items = (
+        OrderItem.objects.order_by("order_id", "id")
+        .values_list("order_id", "book__title")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    for order_id, title in items:
+        count, titles = summaries.get(order_id, (0, []))
+        if len(titles) < SUMMARY_TITLES:
+            titles.append(title)
+        summaries[order_id] = (count + 1, titles)
+
+    order_ids = list(summaries)
+    for start in range(0, len(order_ids), BATCH_SIZE):
+        orders = []
+        for order_id in order_ids[start : start + BATCH_SIZE]:
+            count, titles = summaries[order_id]
+            orders.append(Order(pk=order_id, item_count=count, item_titles=titles))
+        Order.objects.bulk_update(orders, ["item_count", "item_titles"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("orders", "0006_outbox"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="item_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="item_titles",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["user", "created_at", "id"],
+                name="orders_orde_user_id_779e40_idx",
+            ),
+        ),
+        migrations.RunPython(backfill_item_summary, migrations.RunPython.noop),
+    ]
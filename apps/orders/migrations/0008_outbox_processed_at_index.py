@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0007_order_item_summary"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="outboxmessage",
+            index=models.Index(
+                fields=["processed_at"], name="orders_outb_process_9102ae_idx"
+            ),
+        ),
+    ]
@@ -4,24 +4,72 @@ from datetime import timedelta
 from decimal import Decimal
 from django.conf import settings
 from django.db import models
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
 from apps.books.models import Book
 
 
+MONEY_FIELD = DecimalField(max_digits=12, decimal_places=2)
+ZERO = Value(Decimal("0.00"), output_field=MONEY_FIELD)
+# SQLite returns computed decimals unscaled (25.5 rather than 25.50)
+CENT = Decimal("0.01")
+
+
+def _line_total(quantity, price):
+    return ExpressionWrapper(F(quantity) * F(price), output_field=MONEY_FIELD)
+
+
+def _sum_of_lines(quantity, price):
+    """``SUM(quantity * price)``, 0.00 when there are no rows."""
+    return Coalesce(Sum(_line_total(quantity, price)), ZERO, output_field=MONEY_FIELD)
+
+
+class LineItemQuerySet(models.QuerySet):
+    """Totals computed by the database for cart and order items."""
+
+    quantity_field = "quantity"
+    price_field = None
+
+    def with_line_total(self):
+        """Annotate each item with ``line_total`` (quantity x price)."""
+        return self.annotate(line_total=_line_total(self.quantity_field, self.price_field))
+
+    def total(self) -> Decimal:
+        """Sum of the line totals, in one aggregate query."""
+        total = self.aggregate(total=_sum_of_lines(self.quantity_field, self.price_field))["total"]
+        return total.quantize(CENT)
+
+
+class CartItemQuerySet(LineItemQuerySet):
+    price_field = "price_at_add"
+
+
+class OrderItemQuerySet(LineItemQuerySet):
+    price_field = "price"
+
+
+class CartQuerySet(models.QuerySet):
+    def with_total(self):
+        """Annotate each cart with ``items_total``."""
+        return self.annotate(items_total=_sum_of_lines("items__quantity", "items__price_at_add"))
+
+
 class Cart(models.Model):
     """A simple DB-backed cart tied to a user (one cart per user)."""
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
     def __str__(self) -> str:
         return f"Cart({self.user})"
 
     def total(self) -> Decimal:
-        items = self.items.select_related("book").all()
-        return sum((item.quantity * item.price_at_add for item in items), Decimal("0.00"))
+        return self.items.total()
 
 
 class CartItem(models.Model):
@@ -31,6 +79,8 @@ class CartItem(models.Model):
     price_at_add = models.DecimalField(max_digits=8, decimal_places=2)
     added_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = ("cart", "book")
 
@@ -40,7 +90,7 @@ class CartItem(models.Model):
             raise ValidationError("Quantity must be at least 1.")
         if self.book.stock is None:
             return
-        if self.quantity > self.book.stock:
+        if self.quantity > StockShard.objects.available(self.book):
             raise ValidationError("Cannot add more than available stock for this book.")
 
     def save(self, *args, **kwargs):
@@ -71,6 +121,9 @@ class Order(models.Model):
         (STATUS_RETURNED, "Returned"),
     ]
 
+    # number of titles kept in item_titles
+    SUMMARY_TITLES = 3
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="orders")
     status = models.CharField(max_length=32, choices=STATUS_CHOICES, default=STATUS_AWAITING_VERIFICATION)
     # otp_code = models.CharField(max_length=10, blank=True)  # store the verification code
@@ -79,18 +132,44 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     verified_at = models.DateTimeField(null=True, blank=True)
+    # key issued with the cart page; a replayed checkout finds this order
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    # summary of the items stored at checkout (and refreshed when an item is
+    # saved or deleted, see signals.py) so order lists don't load them:
+    # number of order items and the first SUMMARY_TITLES book titles
+    item_count = models.PositiveIntegerField(default=0)
+    item_titles = models.JSONField(default=list, blank=True)
 
     class Meta:
         ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "idempotency_key"], name="unique_order_idempotency_key"),
+        ]
+        indexes = [
+            # order history pages (newest first, keyset on created_at/id)
+            models.Index(fields=["user", "created_at", "id"]),
+        ]
 
     def __str__(self) -> str:
         return f"Order({self.id}) - {self.user} - {self.status}"
 
     def calculate_total(self):
-        total = sum((oi.quantity * oi.price for oi in self.items.select_related("book").all()), Decimal("0.00"))
+        total = self.items.total()
         self.total_amount = total
         return total
 
+    def refresh_item_summary(self):
+        """Recompute ``item_count``/``item_titles`` from the items and store them."""
+        titles = list(self.items.order_by("id").values_list("book__title", flat=True))
+        self.item_count = len(titles)
+        self.item_titles = titles[:self.SUMMARY_TITLES]
+        Order.objects.filter(pk=self.pk).update(item_count=self.item_count, item_titles=self.item_titles)
+
+    @property
+    def more_item_count(self) -> int:
+        """Order items not named in ``item_titles``."""
+        return max(self.item_count - len(self.item_titles), 0)
+
     def mark_verified(self):
         """Mark the order verified and set status to IN_PROGRESS (caller should handle stock decrement transactionally)."""
         self.is_verified = True
@@ -106,6 +185,8 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=8, decimal_places=2)  # snapshot price at order time
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = OrderItemQuerySet.as_manager()
+
     def clean(self):
         if self.quantity < 1:
             raise ValidationError("Order item quantity must be at least 1.")
@@ -122,3 +203,112 @@ class OrderItem(models.Model):
 
     def __str__(self) -> str:
         return f"OrderItem({self.book.title} x {self.quantity})"
+
+
+class StockShardQuerySet(models.QuerySet):
+    def available(self, book) -> int:
+        """Stock ``book`` can sell now: the sum of its shards when it is
+        sharded (``Book.stock`` only mirrors that between syncs), else
+        ``book.stock``."""
+        total = self.filter(book=book).aggregate(total=Sum("stock"))["total"]
+        return book.stock if total is None else total
+
+
+class StockShard(models.Model):
+    """A slice of a hot book's stock.
+
+    Sharded books keep their available stock spread over several rows so
+    concurrent checkouts decrement different rows instead of queueing on the
+    single ``Book`` row. ``Book.stock`` then mirrors the sum of the shards and
+    is refreshed by ``inventory.sync_sharded_stock``; set a sharded book's
+    stock with ``inventory.set_stock``, which writes the shards.
+    """
+    book = models.ForeignKey(Book, related_name="stock_shards", on_delete=models.CASCADE)
+    index = models.PositiveSmallIntegerField()
+    stock = models.IntegerField(default=0)
+
+    objects = StockShardQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["book", "index"], name="unique_stock_shard"),
+        ]
+
+    def __str__(self) -> str:
+        return f"StockShard({self.book_id}#{self.index}: {self.stock})"
+
+
+class StockReservation(models.Model):
+    """Ledger of stock taken out of a book (or one of its shards) for a checkout.
+
+    A HELD reservation expires at ``expires_at``; expired holds are released
+    back to stock by ``inventory.release_expired``. Committing a checkout
+    links the reservation to its order.
+    """
+    STATUS_HELD = "HELD"
+    STATUS_COMMITTED = "COMMITTED"
+    STATUS_RELEASED = "RELEASED"
+
+    STATUS_CHOICES = [
+        (STATUS_HELD, "Held"),
+        (STATUS_COMMITTED, "Committed"),
+        (STATUS_RELEASED, "Released"),
+    ]
+
+    book = models.ForeignKey(Book, related_name="reservations", on_delete=models.PROTECT)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="stock_reservations", on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, related_name="reservations", null=True, blank=True, on_delete=models.SET_NULL)
+    quantity = models.PositiveIntegerField()
+    # shard index the stock came from; None when taken from Book.stock
+    shard = models.PositiveSmallIntegerField(null=True, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "expires_at"]),
+            models.Index(fields=["book", "status"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"StockReservation({self.book_id} x {self.quantity}, {self.status})"
+
+
+class OutboxMessage(models.Model):
+    """A side effect (email, webhook...) recorded by the transaction that caused it.
+
+    Rows are written in the same transaction as the order, so a message exists
+    exactly when its order does, and are delivered afterwards by the
+    ``process_outbox`` worker (see ``outbox.py``). ``available_at`` is when
+    the next delivery attempt may start; failed attempts push it back.
+    ``processed_at`` is set once a message is SENT or FAILED; such rows are
+    deleted after ``ORDERS_OUTBOX_RETENTION_DAYS`` (see ``outbox.prune``).
+    """
+    STATUS_PENDING = "PENDING"
+    STATUS_SENT = "SENT"
+    STATUS_FAILED = "FAILED"
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_SENT, "Sent"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    kind = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "available_at"]),
+            models.Index(fields=["processed_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"OutboxMessage({self.kind}, {self.status})"
@@ -0,0 +1,189 @@
+"""Transactional outbox for order side effects.
+
+Checkout records what has to happen after an order is placed (confirmation
+email, webhooks) as ``OutboxMessage`` rows inside its own transaction and
+returns without doing any I/O. The ``process_outbox`` worker drains the table
+in batches and calls the handler registered for each message ``kind``; other
+apps register handlers for their own background work the same way (e.g. the
+recommender's ``content_neighbors``).
+
+A batch is claimed by pushing ``available_at`` forward by ``LEASE`` in a short
+``SELECT ... FOR UPDATE SKIP LOCKED`` transaction, so several workers can run
+side by side and a message claimed by a worker that dies is picked up again
+once the lease runs out. Failed deliveries are retried with exponential
+backoff until ``max_attempts``, then marked FAILED. Sent and failed rows are
+deleted by ``prune`` once they are older than the retention window.
+"""
+import logging
+import random
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Order, OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+# how long a claimed message is hidden from other workers
+LEASE = timedelta(minutes=5)
+BACKOFF_BASE = 30  # seconds before the first retry
+BACKOFF_MAX = 60 * 60
+
+WEBHOOK_TIMEOUT = 10
+PRUNE_BATCH_SIZE = 1000
+
+_handlers = {}
+
+
+def register(kind):
+    """Decorator registering the delivery function for messages of ``kind``.
+
+    The function receives the message payload and raises to signal failure.
+    """
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def max_attempts():
+    return getattr(settings, "ORDERS_OUTBOX_MAX_ATTEMPTS", 8)
+
+
+def retention():
+    return timedelta(days=getattr(settings, "ORDERS_OUTBOX_RETENTION_DAYS", 7))
+
+
+def backoff(attempts):
+    """Delay before retrying a message that failed ``attempts`` times."""
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    # jitter so messages that failed together don't retry in lockstep
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def enqueue(kind, payload, delay=None):
+    """Record a message; call inside the transaction that causes it."""
+    return OutboxMessage.objects.create(
+        kind=kind, payload=payload, available_at=timezone.now() + (delay or timedelta())
+    )
+
+
+def enqueue_order_placed(order):
+    """Queue the confirmation email and webhooks for a new ``order``."""
+    messages = [OutboxMessage(kind="order_confirmation", payload={"order_id": order.pk})]
+    body = {
+        "event": "order.placed",
+        "order_id": order.pk,
+        "user_id": order.user_id,
+        "status": order.status,
+        "total_amount": str(order.total_amount),
+    }
+    messages.extend(
+        OutboxMessage(kind="webhook", payload={"url": url, "body": body})
+        for url in getattr(settings, "ORDERS_WEBHOOK_URLS", [])
+    )
+    return OutboxMessage.objects.bulk_create(messages)
+
+
+def _claim(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxMessage.STATUS_PENDING, available_at__lte=now)
+            .order_by("available_at", "id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        OutboxMessage.objects.filter(id__in=ids).update(available_at=now + LEASE, attempts=F("attempts") + 1)
+    return list(OutboxMessage.objects.filter(id__in=ids).order_by("id"))
+
+
+def _deliver(message):
+    handler = _handlers.get(message.kind)
+    if handler is None:
+        raise LookupError(f"No outbox handler for {message.kind!r}")
+    handler(message.payload)
+
+
+def process_batch(batch_size=50):
+    """Claim and deliver up to ``batch_size`` due messages.
+
+    Returns ``(sent, failed)`` counts for this batch; ``failed`` includes
+    messages that will be retried later.
+    """
+    sent, failed = [], 0
+    for message in _claim(batch_size):
+        try:
+            _deliver(message)
+        except Exception as exc:
+            failed += 1
+            logger.warning("Outbox message %s (%s) failed: %s", message.pk, message.kind, exc)
+            update = {"last_error": f"{type(exc).__name__}: {exc}"[:2000]}
+            if message.attempts >= max_attempts():
+                update["status"] = OutboxMessage.STATUS_FAILED
+                update["processed_at"] = timezone.now()
+            else:
+                update["available_at"] = timezone.now() + backoff(message.attempts)
+            OutboxMessage.objects.filter(pk=message.pk).update(**update)
+        else:
+            sent.append(message.pk)
+    if sent:
+        OutboxMessage.objects.filter(pk__in=sent).update(
+            status=OutboxMessage.STATUS_SENT, processed_at=timezone.now(), last_error=""
+        )
+    return len(sent), failed
+
+
+def prune(batch_size=PRUNE_BATCH_SIZE):
+    """Delete sent and failed messages processed before the retention
+    window, ``batch_size`` rows per statement; returns how many."""
+    cutoff = timezone.now() - retention()
+    deleted = 0
+    while True:
+        ids = list(
+            OutboxMessage.objects.filter(processed_at__lt=cutoff)
+            .exclude(status=OutboxMessage.STATUS_PENDING)
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += OutboxMessage.objects.filter(id__in=ids).delete()[0]
+
+
+# -- handlers ---------------------------------------------------------------
+
+
+@register("order_confirmation")
+def send_order_confirmation(payload):
+    order = (
+        Order.objects.select_related("user")
+        .prefetch_related("items__book")
+        .filter(pk=payload["order_id"])
+        .first()
+    )
+    if order is None or not order.user.email:
+        return
+    lines = [f"- {item.book.title} x {item.quantity}: ₹{item.price * item.quantity}" for item in order.items.all()]
+    message = "\n".join([
+        f"Hi {order.user.get_username()},",
+        "",
+        f"Thanks for your order #{order.pk}. It is now {order.get_status_display().lower()}.",
+        "",
+        *lines,
+        "",
+        f"Total: ₹{order.total_amount}",
+    ])
+    send_mail(f"Your Bookscart order #{order.pk}", message, settings.DEFAULT_FROM_EMAIL, [order.user.email])
+
+
+@register("webhook")
+def post_webhook(payload):
+    response = requests.post(payload["url"], json=payload["body"], timeout=WEBHOOK_TIMEOUT)
+    response.raise_for_status()
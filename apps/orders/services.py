@@ -0,0 +1,116 @@
+"""Order placement.
+
+``place_order`` turns a user's cart into an order. Stock is first reserved
+(see ``inventory.py``) in a short transaction, so book rows are never locked
+while the order itself is written. The order, its bulk-inserted items, the
+reservation commit and the cart cleanup then happen in one transaction with
+a constant number of queries whatever the size of the cart.
+
+Checkouts carry an idempotency key issued with the cart page. A replayed
+request (double submit, retry after a worker timeout) finds the order that
+key already produced and returns it without reserving stock again; the
+unique constraint on ``(user, idempotency_key)`` settles concurrent replays.
+
+Side effects of a new order are only queued in the outbox (``outbox.py``);
+nothing slow runs while the checkout transaction is open.
+"""
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.books.models import Book
+
+from . import inventory, outbox
+from .cache import invalidate_cart_count
+from .models import Cart, Order, OrderItem
+
+
+class CheckoutError(Exception):
+    """The cart cannot be turned into an order; the message is user-facing."""
+
+
+def _order_for_key(user, idempotency_key):
+    if not idempotency_key:
+        return None
+    return Order.objects.filter(user=user, idempotency_key=idempotency_key).first()
+
+
+def place_order(user, idempotency_key=None):
+    """Create an in-progress order from ``user``'s cart and remove the
+    ordered lines from it.
+
+    Returns ``(order, created)``. When ``idempotency_key`` already produced
+    an order, that order is returned with ``created=False`` and nothing else
+    is done.
+
+    Raises ``CheckoutError`` when the cart is empty or a book does not have
+    enough stock; nothing is written in that case.
+    """
+    existing = _order_for_key(user, idempotency_key)
+    if existing is not None:
+        return existing, False
+
+    cart = Cart.objects.filter(user=user).first()
+    lines = (
+        list(cart.items.order_by("id").values_list("id", "book_id", "quantity", "price_at_add", "book__title"))
+        if cart else []
+    )
+    if not lines:
+        # a concurrent request with the same key may have just emptied the cart
+        existing = _order_for_key(user, idempotency_key)
+        if existing is not None:
+            return existing, False
+        raise CheckoutError("Your cart is empty.")
+    quantities = {book_id: qty for _, book_id, qty, _, _ in lines}
+
+    try:
+        reservations = inventory.reserve(user, quantities)
+    except inventory.InsufficientStock as exc:
+        title = Book.objects.filter(pk=exc.book_id).values_list("title", flat=True).first()
+        raise CheckoutError(f"Insufficient stock for {title or 'a book in your cart'}. Please adjust your cart.")
+
+    try:
+        with transaction.atomic():
+            total = sum((qty * price for _, _, qty, price, _ in lines), Decimal("0.00"))
+            order = Order.objects.create(
+                user=user,
+                total_amount=total,
+                # mark as in-progress / verified immediately
+                is_verified=True,
+                status=Order.STATUS_IN_PROGRESS,
+                verified_at=timezone.now(),
+                idempotency_key=idempotency_key or None,
+                item_count=len(lines),
+                item_titles=[title for *_, title in lines[:Order.SUMMARY_TITLES]],
+            )
+            # stock was already checked by the reservation, so skip the
+            # per-item full_clean() of OrderItem.save()
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, book_id=book_id, quantity=qty, price=price)
+                for _, book_id, qty, price, _ in lines
+            ])
+            if not inventory.commit(reservations, order):
+                raise CheckoutError("Your checkout took too long and the stock was released. Please try again.")
+
+            # remove the ordered lines; items added or changed since they
+            # were read stay in the cart
+            cart.items.filter(reduce(or_, (Q(id=item_id, quantity=qty) for item_id, _, qty, _, _ in lines))).delete()
+            # emails/webhooks are sent by the outbox worker after commit
+            outbox.enqueue_order_placed(order)
+    except IntegrityError:
+        inventory.release(reservations)
+        # lost the race against a replay of the same request
+        existing = _order_for_key(user, idempotency_key)
+        if existing is None:
+            raise
+        return existing, False
+    except Exception:
+        inventory.release(reservations)
+        raise
+
+    transaction.on_commit(lambda: invalidate_cart_count(user.pk))
+    return order, True
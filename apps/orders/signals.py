@@ -0,0 +1,39 @@
+# apps/orders/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_cart_count
+from .models import Cart, CartItem, Order, OrderItem
+from .stats import invalidate_order_stats
+
+
+def _cart_user_id(item):
+    # the cart is usually cached on the instance already (cart views, cascades)
+    if CartItem.cart.is_cached(item):
+        return item.cart.user_id
+    return Cart.objects.filter(pk=item.cart_id).values_list("user_id", flat=True).first()
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def refresh_cart_count(sender, instance, **kwargs):
+    """Drop the cached cart badge count once the cart change is committed."""
+    user_id = _cart_user_id(instance)
+    if user_id is not None:
+        transaction.on_commit(lambda: invalidate_cart_count(user_id))
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def refresh_order_stats(sender, instance, **kwargs):
+    """New, deleted or re-statused orders make the stats snapshot stale."""
+    transaction.on_commit(invalidate_order_stats)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def refresh_order_summary(sender, instance, **kwargs):
+    """Keep the order's item summary in step with items edited after checkout
+    (checkout itself bulk-inserts them and writes the summary)."""
+    Order(pk=instance.order_id).refresh_item_summary()
@@ -0,0 +1,81 @@
+"""Order statistics snapshot (used by the admin chatbot context).
+
+All figures come from one conditional-aggregation query over ``Order``, and
+the result is cached as a snapshot for ``ORDERS_STATS_TIMEOUT`` seconds.
+Saving or deleting an order drops it (see ``signals.py``); bulk ``update()``
+calls bypass the signals and are picked up when the snapshot expires.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Order
+
+STATS_KEY = "orders:stats"
+
+# orders whose amount counts as revenue
+REVENUE_STATUSES = (Order.STATUS_IN_PROGRESS, Order.STATUS_DELIVERED)
+
+# recent periods reported next to the all-time figures
+PERIODS = (("24h", timedelta(days=1)), ("7d", timedelta(days=7)), ("30d", timedelta(days=30)))
+
+
+def stats_timeout():
+    return getattr(settings, "ORDERS_STATS_TIMEOUT", 300)
+
+
+def _revenue(condition):
+    money = DecimalField(max_digits=14, decimal_places=2)
+    return Coalesce(
+        Sum("total_amount", filter=condition, output_field=money),
+        Value(Decimal("0.00"), output_field=money),
+    )
+
+
+def compute_order_stats(now=None):
+    """Count orders per status, plus revenue and recent-period figures.
+
+    Returns a dict with ``total``, ``by_status`` (status -> count),
+    ``revenue``, ``periods`` (label -> ``{"orders", "revenue"}``) and
+    ``computed_at``.
+    """
+    now = now or timezone.now()
+    paid = Q(status__in=REVENUE_STATUSES)
+    aggregates = {"total": Count("id"), "revenue": _revenue(paid)}
+    for status, _ in Order.STATUS_CHOICES:
+        aggregates[f"status_{status}"] = Count("id", filter=Q(status=status))
+    for label, delta in PERIODS:
+        recent = Q(created_at__gte=now - delta)
+        aggregates[f"orders_{label}"] = Count("id", filter=recent)
+        aggregates[f"revenue_{label}"] = _revenue(recent & paid)
+
+    row = Order.objects.aggregate(**aggregates)
+    cent = Decimal("0.01")
+    return {
+        "total": row["total"],
+        "by_status": {status: row[f"status_{status}"] for status, _ in Order.STATUS_CHOICES},
+        "revenue": row["revenue"].quantize(cent),
+        "periods": {
+            label: {"orders": row[f"orders_{label}"], "revenue": row[f"revenue_{label}"].quantize(cent)}
+            for label, _ in PERIODS
+        },
+        "computed_at": now,
+    }
+
+
+def get_order_stats():
+    """The cached stats snapshot, recomputed when missing or expired."""
+    stats = cache.get(STATS_KEY)
+    if stats is None:
+        stats = compute_order_stats()
+        cache.set(STATS_KEY, stats, stats_timeout())
+    return stats
+
+
+def invalidate_order_stats():
+    cache.delete(STATS_KEY)
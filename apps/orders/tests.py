@@ -1,3 +1,160 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+
+from apps.books.models import Book
+
+from . import inventory, outbox, services
+from .models import Cart, CartItem, Order, OrderItem, OutboxMessage, StockReservation, StockShard
+from .services import CheckoutError, place_order
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("reader", password="x")
+        self.book = Book.objects.create(title="Dune", price="10.00", stock=12)
+
+    def stock(self):
+        return StockShard.objects.available(Book.objects.get(pk=self.book.pk))
+
+    def test_release_after_unsharding_returns_stock_to_the_book(self):
+        inventory.shard_stock(self.book.pk, 4)
+        held = inventory.reserve(self.user, {self.book.pk: 5})
+        self.assertEqual(self.stock(), 7)
+        inventory.shard_stock(self.book.pk, 1)
+        inventory.release(held)
+        self.assertEqual(self.stock(), 12)
+        self.assertFalse(StockShard.objects.filter(book=self.book).exists())
+
+    def test_release_after_resharding_returns_stock_to_a_shard(self):
+        inventory.shard_stock(self.book.pk, 4)
+        held = inventory.reserve(self.user, {self.book.pk: 5})
+        inventory.shard_stock(self.book.pk, 2)
+        inventory.release(held)
+        self.assertEqual(self.stock(), 12)
+        self.assertEqual(
+            StockReservation.objects.filter(status=StockReservation.STATUS_RELEASED).count(), len(held)
+        )
+
+    def test_release_of_a_missing_shard_falls_back(self):
+        inventory.shard_stock(self.book.pk, 4)
+        held = inventory.reserve(self.user, {self.book.pk: 3})
+        StockShard.objects.filter(book=self.book, index__in=[r.shard for r in held]).delete()
+        before = self.stock()
+        inventory.release(held)
+        self.assertEqual(self.stock(), before + 3)
+
+
+class PlaceOrderTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("buyer", password="x")
+        self.cart, _ = Cart.objects.get_or_create(user=self.user)
+        self.dune = Book.objects.create(title="Dune", price="10.00", stock=5)
+        self.emma = Book.objects.create(title="Emma", price="8.00", stock=3)
+
+    def add(self, book, quantity):
+        return CartItem.objects.create(cart=self.cart, book=book, quantity=quantity, price_at_add=book.price)
+
+    def stock(self, book):
+        return Book.objects.values_list("stock", flat=True).get(pk=book.pk)
+
+    def test_order_decrements_stock_and_empties_the_cart(self):
+        self.add(self.dune, 2)
+        self.add(self.emma, 1)
+        order, created = place_order(self.user)
+        self.assertTrue(created)
+        self.assertEqual(order.total_amount, 28)
+        self.assertEqual(order.item_count, 2)
+        self.assertEqual((self.stock(self.dune), self.stock(self.emma)), (3, 2))
+        self.assertFalse(self.cart.items.exists())
+        self.assertEqual(
+            set(StockReservation.objects.filter(order=order).values_list("status", flat=True)),
+            {StockReservation.STATUS_COMMITTED},
+        )
+
+    def test_lines_changed_during_checkout_stay_in_the_cart(self):
+        self.add(self.dune, 2)
+        emma = self.add(self.emma, 1)
+        reserve = inventory.reserve
+
+        def reserve_then_edit(user, quantities, ttl=None):
+            rows = reserve(user, quantities, ttl)
+            # the user bumps a quantity in another tab while the order is written
+            CartItem.objects.filter(pk=emma.pk).update(quantity=2)
+            return rows
+
+        with mock.patch.object(inventory, "reserve", reserve_then_edit):
+            order, _ = place_order(self.user)
+        self.assertEqual(list(order.items.values_list("book_id", "quantity")), [(self.dune.pk, 2), (self.emma.pk, 1)])
+        self.assertEqual(list(self.cart.items.values_list("book_id", "quantity")), [(self.emma.pk, 2)])
+
+    def test_out_of_stock_book_rolls_back_the_checkout(self):
+        self.add(self.dune, 2)
+        self.add(self.emma, 3)
+        Book.objects.filter(pk=self.emma.pk).update(stock=2)
+        with self.assertRaises(CheckoutError):
+            place_order(self.user)
+        self.assertEqual((self.stock(self.dune), self.stock(self.emma)), (5, 2))
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(self.cart.items.count(), 2)
+
+    def test_replayed_key_returns_the_same_order(self):
+        self.add(self.dune, 2)
+        order, created = place_order(self.user, idempotency_key="k1")
+        self.assertTrue(created)
+        again, created = place_order(self.user, idempotency_key="k1")
+        self.assertEqual((again, created), (order, False))
+        self.assertEqual(self.stock(self.dune), 3)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_reused_key_with_a_different_cart_places_nothing(self):
+        self.add(self.dune, 2)
+        order, _ = place_order(self.user, idempotency_key="k1")
+        self.add(self.emma, 1)
+        again, created = place_order(self.user, idempotency_key="k1")
+        self.assertEqual((again, created), (order, False))
+        self.assertEqual(self.stock(self.emma), 3)
+        self.assertEqual(list(self.cart.items.values_list("book_id", flat=True)), [self.emma.pk])
+
+    def test_concurrent_replay_releases_the_stock_of_the_loser(self):
+        self.add(self.dune, 2)
+        # the other request commits its order after this one checked the key
+        winner = Order.objects.create(user=self.user, total_amount=20, idempotency_key="k1")
+        with mock.patch.object(services, "_order_for_key", side_effect=[None, winner]) as order_for_key:
+            order, created = place_order(self.user, idempotency_key="k1")
+        self.assertEqual((order, created), (winner, False))
+        self.assertEqual(order_for_key.call_count, 2)
+        self.assertEqual(self.stock(self.dune), 5)
+        self.assertEqual(
+            set(StockReservation.objects.values_list("status", flat=True)), {StockReservation.STATUS_RELEASED}
+        )
+        self.assertEqual(self.cart.items.count(), 1)
+
+    def test_item_summary_follows_item_edits(self):
+        self.add(self.dune, 1)
+        order, _ = place_order(self.user)
+        self.assertEqual((order.item_count, order.item_titles), (1, ["Dune"]))
+        item = OrderItem.objects.create(order=order, book=self.emma, quantity=1, price=self.emma.price)
+        order.refresh_from_db()
+        self.assertEqual((order.item_count, order.item_titles), (2, ["Dune", "Emma"]))
+        item.delete()
+        order.refresh_from_db()
+        self.assertEqual((order.item_count, order.item_titles), (1, ["Dune"]))
+
 
-# Create your tests here.
+class OutboxPruneTests(TestCase):
+    def test_prune_deletes_only_processed_messages_past_retention(self):
+        old = timezone.now() - outbox.retention() - timedelta(hours=1)
+        recent = timezone.now() - timedelta(hours=1)
+        rows = OutboxMessage.objects.bulk_create([
+            OutboxMessage(kind="webhook", status=OutboxMessage.STATUS_SENT, processed_at=old),
+            OutboxMessage(kind="webhook", status=OutboxMessage.STATUS_FAILED, processed_at=old),
+            OutboxMessage(kind="webhook", status=OutboxMessage.STATUS_SENT, processed_at=recent),
+            OutboxMessage(kind="webhook", status=OutboxMessage.STATUS_PENDING),
+        ])
+        self.assertEqual(outbox.prune(batch_size=1), 2)
+        self.assertEqual(set(OutboxMessage.objects.values_list("pk", flat=True)), {rows[2].pk, rows[3].pk})
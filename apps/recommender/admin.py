@@ -1,3 +1,27 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import BookNeighbor, RecommendationRun, UserRecommendation
+
+
+@admin.register(BookNeighbor)
+class BookNeighborAdmin(admin.ModelAdmin):
+    list_display = ("book", "rank", "neighbor", "kind", "score")
+    list_filter = ("kind",)
+    list_select_related = ("book", "neighbor")
+    search_fields = ("book__title", "neighbor__title")
+    raw_id_fields = ("book", "neighbor")
+
+
+@admin.register(UserRecommendation)
+class UserRecommendationAdmin(admin.ModelAdmin):
+    list_display = ("user", "rank", "book", "score", "computed_at")
+    list_select_related = ("user", "book")
+    search_fields = ("user__username", "book__title")
+    raw_id_fields = ("user", "book")
+
+
+@admin.register(RecommendationRun)
+class RecommendationRunAdmin(admin.ModelAdmin):
+    list_display = ("id", "status", "incremental", "started_at", "finished_at", "users", "rows")
+    list_filter = ("status", "incremental")
+    readonly_fields = ("status", "incremental", "started_at", "finished_at", "users", "rows")
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RecommenderConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.recommender"
+
+    def ready(self):
+        # Import signals so content neighbours follow Book saves/deletes
+        import apps.recommender.signals  # noqa
@@ -0,0 +1,70 @@
+"""Item-to-item "customers also bought" recommendations.
+
+Purchases are loaded once into a binary user x book sparse matrix ``X`` (a
+user either bought a book or not; quantities and repeat orders add no
+weight). One sparse product then gives every co-purchase count at once:
+
+    C = Xᵀ X                              C[i, j] = users who bought i and j
+    S[i, j] = C[i, j] / √(C[i, i] C[j, j])   cosine similarity
+
+Only the top ``k`` neighbours of each book are kept, as ``BookNeighbor``
+rows of kind ``co_purchase``, so pages read them with one indexed lookup.
+"""
+import numpy as np
+from django.conf import settings
+from scipy import sparse
+
+from apps.orders.models import Order, OrderItem
+
+from .models import BookNeighbor
+from .neighbors import neighbor_rows, replace, top_k
+
+# orders that never went through don't say anything about tastes
+IGNORED_STATUSES = (Order.STATUS_CANCELLED,)
+
+
+def default_top_k():
+    return getattr(settings, "RECOMMENDER_TOP_K", 10)
+
+
+def purchase_matrix():
+    """``(X, book_ids)``: the binary user x book CSR matrix and the book id
+    of each of its columns."""
+    pairs = np.array(
+        OrderItem.objects.exclude(order__status__in=IGNORED_STATUSES)
+        .values_list("order__user_id", "book_id")
+        .distinct(),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    user_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    book_ids, cols = np.unique(pairs[:, 1], return_inverse=True)
+    X = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (rows, cols)),
+        shape=(len(user_ids), len(book_ids)),
+    )
+    return X, book_ids
+
+
+def similarity(X, min_support=1):
+    """Book x book cosine similarity of the columns of ``X`` (CSR, zero
+    diagonal). Pairs bought together by fewer than ``min_support`` users are
+    dropped."""
+    C = (X.T @ X).tocsr()
+    buyers = C.diagonal()
+    C = (C - sparse.diags(buyers)).tocsr()
+    if min_support > 1:
+        C.data[C.data < min_support] = 0
+    C.eliminate_zeros()
+    inv_norm = sparse.diags(1 / np.sqrt(np.maximum(buyers, 1)))
+    return (inv_norm @ C @ inv_norm).tocsr()
+
+
+def build(k=None, min_support=1, batch_size=1000):
+    """Recompute the co-purchase neighbours of every book; returns the
+    number of rows written."""
+    k = k or default_top_k()
+    X, book_ids = purchase_matrix()
+    rows = []
+    for row, cols, scores in top_k(similarity(X, min_support), k):
+        rows.extend(neighbor_rows(BookNeighbor.KIND_CO_PURCHASE, book_ids[row], book_ids[cols], scores))
+    return replace(BookNeighbor.KIND_CO_PURCHASE, rows, batch_size=batch_size)
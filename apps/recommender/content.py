@@ -0,0 +1,153 @@
+"""Content-based "similar books" from titles, authors, genres and descriptions.
+
+New books have no purchase history, so they get neighbours from their text
+instead. Each book becomes a sparse TF-IDF vector over the hashed features
+of ``features.py`` (word unigrams and bigrams of every field, weighted by
+field, plus the whole author and genre). Hashing needs no stored
+vocabulary, so one book can be vectorized on its own. Rows are
+L2-normalised, so a sparse product of two rows is their cosine similarity.
+
+``ContentIndex.rebuild`` vectorizes the catalog and stores the top ``k``
+neighbours of every book as ``BookNeighbor`` rows of kind ``content``.
+Between rebuilds the ``Book`` signals queue a ``content_neighbors`` outbox
+message per write, and the ``process_outbox`` worker calls
+``update_neighbors``: it vectorizes the catalog as it is in the database,
+scores the written book against it with one sparse product and rewrites the
+neighbours of that book and of the books it now ranks for. Requests that
+save a book do no vectorizing, and no matrix is kept between messages, so
+several workers can't drift apart.
+"""
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Min
+from scipy import sparse
+
+from apps.books.models import Book
+
+from .features import FIELD_WEIGHTS, N_FEATURES, book_features
+from .models import BookNeighbor
+from .neighbors import neighbor_rows, replace, top_k
+
+KIND = BookNeighbor.KIND_CONTENT
+
+# pairs scoring lower than this are noise (a shared common word)
+MIN_SCORE = 0.05
+# rows scored per sparse product in a rebuild
+BLOCK_SIZE = 512
+# books whose neighbour lists an update may change, best scores first
+MAX_AFFECTED = 500
+
+
+def default_top_k():
+    return getattr(settings, "RECOMMENDER_TOP_K", 10)
+
+
+def term_matrix(books):
+    """Sublinear term-frequency CSR matrix, one row per book."""
+    indptr, indices, data = [0], [], []
+    for book in books:
+        counts = book_features(book)
+        indices.extend(counts)
+        data.extend(counts.values())
+        indptr.append(len(indices))
+    tf = sparse.csr_matrix(
+        (np.log1p(np.array(data, dtype=np.float32)), np.array(indices, dtype=np.int32), indptr),
+        shape=(len(books), N_FEATURES),
+    )
+    tf.sort_indices()
+    return tf
+
+
+def idf_weights(tf):
+    """Smoothed inverse document frequency of every bucket."""
+    df = np.bincount(tf.indices, minlength=N_FEATURES)
+    return (np.log((1 + tf.shape[0]) / (1 + df)) + 1).astype(np.float32)
+
+
+def tfidf(tf, idf):
+    """``tf`` weighted by ``idf``, rows L2-normalised."""
+    X = (tf @ sparse.diags(idf)).tocsr()
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    return (sparse.diags(1 / np.maximum(norms, 1e-12)) @ X).tocsr()
+
+
+class ContentIndex:
+    """TF-IDF matrix of the catalog plus its row -> book id mapping, loaded
+    from the database when created."""
+
+    def __init__(self):
+        books = list(Book.objects.only(*FIELD_WEIGHTS).order_by("id"))
+        tf = term_matrix(books)
+        self.idf = idf_weights(tf)
+        self.matrix = tfidf(tf, self.idf)  # books x N_FEATURES, L2-normalised rows
+        self.book_ids = np.array([book.pk for book in books], dtype=np.int64)  # book id of each row
+
+    def _neighbor_rows(self, rows, k):
+        """``BookNeighbor`` rows for the books at matrix ``rows``."""
+        rows = np.asarray(rows, dtype=np.int64)
+        S = (self.matrix[rows] @ self.matrix.T).tocsr()
+        result = []
+        for i, cols, scores in top_k(S, k, MIN_SCORE, exclude=rows):
+            result.extend(neighbor_rows(KIND, self.book_ids[rows[i]], self.book_ids[cols], scores))
+        return result
+
+    def rebuild(self, k=None, batch_size=1000):
+        """Re-vectorize the catalog and store every book's neighbours;
+        returns the number of rows written."""
+        k = k or default_top_k()
+        result = []
+        for start in range(0, len(self.book_ids), BLOCK_SIZE):
+            result.extend(self._neighbor_rows(range(start, min(start + BLOCK_SIZE, len(self.book_ids))), k))
+        return replace(KIND, result, batch_size=batch_size)
+
+    def _row_of(self, book_id):
+        pos = np.searchsorted(self.book_ids, book_id)
+        if pos < len(self.book_ids) and self.book_ids[pos] == book_id:
+            return int(pos)
+        return None
+
+    def update_book(self, book_id, k=None):
+        """Refresh the neighbours ``book_id``'s text affects: its own and
+        those of the books it now ranks for or is listed by. Returns the
+        number of books whose neighbours were rewritten."""
+        k = k or default_top_k()
+        row = self._row_of(book_id)
+        if row is None:
+            return 0
+        scores = (self.matrix @ self.matrix[row].T).toarray().ravel()
+        scores[row] = 0
+
+        # books the book may rank for: the best scoring ones whose list is
+        # short or ends below their score, plus those listing it now
+        candidates = np.flatnonzero(scores > MIN_SCORE)
+        candidates = candidates[np.argsort(-scores[candidates])[:MAX_AFFECTED]]
+        listed = {
+            entry["book_id"]: entry
+            for entry in BookNeighbor.objects.filter(kind=KIND, book_id__in=self.book_ids[candidates].tolist())
+            .values("book_id")
+            .annotate(count=Count("id"), lowest=Min("score"))
+        }
+        affected = {row}
+        for pos in candidates:
+            entry = listed.get(int(self.book_ids[pos]))
+            if entry is None or entry["count"] < k or entry["lowest"] < scores[pos]:
+                affected.add(int(pos))
+        listing = BookNeighbor.objects.filter(kind=KIND, neighbor_id=book_id).values_list("book_id", flat=True)
+        return self.refresh(self.book_ids[sorted(affected)].tolist() + list(listing), k)
+
+    def refresh(self, book_ids, k=None):
+        """Recompute the neighbours of ``book_ids``; returns how many books
+        were rewritten (ids no longer in the catalog are skipped)."""
+        rows = sorted({row for row in map(self._row_of, book_ids) if row is not None})
+        if not rows:
+            return 0
+        replace(KIND, self._neighbor_rows(rows, k or default_top_k()), book_ids=self.book_ids[rows].tolist())
+        return len(rows)
+
+
+def update_neighbors(book_id=None, listed_by=()):
+    """Outbox handler body: refresh the neighbours a write of ``book_id``
+    affects, and those of ``listed_by`` (books that listed a deleted book)."""
+    index = ContentIndex()
+    updated = index.update_book(book_id) if book_id is not None else 0
+    return updated + index.refresh(listed_by)
@@ -0,0 +1,45 @@
+"""Hashed text features of books, shared by the content and semantic indexes.
+
+Features are word unigrams and bigrams (plus the whole author and genre of a
+book), hashed with ``crc32`` into ``N_FEATURES`` buckets. Hashing needs no
+stored vocabulary and is stable across processes, so any book or query can
+be turned into features on its own.
+"""
+import zlib
+from collections import Counter
+
+from apps.books.search import tokenize
+
+N_FEATURES = 2 ** 18
+FIELD_WEIGHTS = {"title": 3.0, "author": 2.0, "genre": 2.0, "description": 1.0}
+
+
+def bucket(feature):
+    return zlib.crc32(feature.encode()) & (N_FEATURES - 1)
+
+
+def add_text(counts, text, weight=1.0):
+    """Add the unigrams and bigrams of ``text`` to ``counts``."""
+    words = [w for w in tokenize(text) if len(w) > 1]
+    for word in words:
+        counts[bucket(word)] += weight
+    for pair in zip(words, words[1:]):
+        counts[bucket(" ".join(pair))] += weight
+    return counts
+
+
+def text_features(text):
+    """Term counts of free text (a search query) as ``{bucket: weight}``."""
+    return add_text(Counter(), text)
+
+
+def book_features(book):
+    """Weighted term counts of ``book`` as ``{bucket: weight}``."""
+    counts = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        add_text(counts, getattr(book, field, ""), weight)
+    for field in ("author", "genre"):
+        value = " ".join(tokenize(getattr(book, field, "")))
+        if value:
+            counts[bucket(f"{field}={value}")] += FIELD_WEIGHTS[field]
+    return counts
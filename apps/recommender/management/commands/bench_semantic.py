@@ -0,0 +1,56 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.books.models import Book
+from apps.recommender import semantic
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the semantic vector index: time uncached text queries and "
+        "\"related titles\" lookups against random catalog books and report "
+        "p50/p99 latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--limit", type=int, default=10, help="Results per query.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        books = list(Book.objects.only("title", "author", "genre", "description"))
+        if not books:
+            raise CommandError("The catalog is empty.")
+        rng = random.Random(options["seed"])
+        sample = [rng.choice(books) for _ in range(options["queries"])]
+
+        started = time.perf_counter()
+        index = semantic.get_vector_index()
+        embedder = semantic.get_embedder()
+        self.stdout.write(
+            f"{type(index).__name__}: {index.count()} books, ready in {time.perf_counter() - started:.2f}s"
+        )
+
+        def search(book):
+            # a few words of the title and genre, like a typed query
+            words = f"{book.title} {book.genre}".split()
+            index.query(embedder.embed_query(" ".join(words[:4])), options["limit"])
+
+        def related(book):
+            index.query(embedder.embed_books([book])[0], options["limit"] + 1)
+
+        for label, func in (("search", search), ("related", related)):
+            latencies = []
+            for book in sample:
+                start = time.perf_counter()
+                func(book)
+                latencies.append(time.perf_counter() - start)
+            latencies.sort()
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(
+                f"  {label}: {len(latencies)} queries, p50 {statistics.median(latencies) * 1000:.2f}ms, "
+                f"p99 {p99 * 1000:.2f}ms"
+            )
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.recommender import co_purchase, semantic
+from apps.recommender.content import ContentIndex
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the precomputed book neighbours: \"customers also bought\" "
+        "(item-item cosine over purchases) and content similarity (TF-IDF "
+        "over titles, authors, genres and descriptions), top K per book, and "
+        "re-embed the catalog into the semantic vector index. An in-process "
+        "vector index (NumpyVectorIndex) is only rebuilt in this command; "
+        "running workers keep their own copy in step with Book writes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--kind", choices=["all", "co_purchase", "content", "semantic"], default="all", help="Which table to rebuild."
+        )
+        parser.add_argument("--top-k", type=int, default=None, help="Neighbours kept per book (default RECOMMENDER_TOP_K).")
+        parser.add_argument(
+            "--min-support", type=int, default=1, help="Ignore pairs bought together by fewer users than this."
+        )
+
+    def handle(self, *args, **options):
+        kind = options["kind"]
+        if kind in ("all", "co_purchase"):
+            started = time.perf_counter()
+            written = co_purchase.build(k=options["top_k"], min_support=options["min_support"])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"Stored {written} co-purchase neighbours in {elapsed:.2f}s.")
+        if kind in ("all", "content"):
+            started = time.perf_counter()
+            written = ContentIndex().rebuild(k=options["top_k"])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"Stored {written} content neighbours in {elapsed:.2f}s.")
+        if kind in ("all", "semantic"):
+            started = time.perf_counter()
+            indexed = semantic.rebuild()
+            elapsed = time.perf_counter() - started
+            index = semantic.get_vector_index()
+            self.stdout.write(f"Embedded {indexed} books into {type(index).__name__} in {elapsed:.2f}s.")
+            if not index.shared:
+                self.stdout.write(
+                    "The vector index lives in each process: running workers keep "
+                    "their own copy in step with Book writes."
+                )
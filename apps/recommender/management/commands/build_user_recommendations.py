@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.utils import timezone
+
+from apps.recommender import personal, serving
+from apps.recommender.co_purchase import default_top_k
+from apps.recommender.models import RecommendationRun, UserRecommendation
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute personalized recommendations for every active user with "
+        "orders, scoring user-id shards in a process pool. --incremental only "
+        "recomputes users whose orders changed since the last successful run. "
+        "Run build_recommendations first: scores come from the book neighbours."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--incremental", action="store_true")
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count() or 1,
+            help="Worker processes (forced to 1 on SQLite, which serializes writers).",
+        )
+        parser.add_argument("--shard-size", type=int, default=500, help="Users per shard.")
+        parser.add_argument("--top-k", type=int, default=None, help="Recommendations per user (default RECOMMENDER_TOP_K).")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        since = None
+        if options["incremental"]:
+            last = RecommendationRun.objects.filter(status=RecommendationRun.STATUS_SUCCEEDED).first()
+            if last is None:
+                self.stdout.write("No previous run: computing everyone.")
+            else:
+                since = last.started_at
+        run = RecommendationRun.objects.create(incremental=since is not None)
+
+        try:
+            user_ids = personal.users_to_score(since)
+            size = max(options["shard_size"], 1)
+            shards = [user_ids[i:i + size] for i in range(0, len(user_ids), size)]
+            workers = max(1, min(options["workers"], len(shards)))
+            if workers > 1 and connection.vendor == "sqlite":
+                self.stdout.write("SQLite: using 1 worker.")
+                workers = 1
+            state = personal.ScoringState(options["top_k"] or default_top_k())
+            self.stdout.write(
+                f"Scoring {len(user_ids)} users in {len(shards)} shard(s) with {workers} worker(s) "
+                f"over {len(state.book_ids)} books with neighbours."
+            )
+            users = rows = 0
+            for done_users, done_rows in self._run_shards(shards, state, workers):
+                users += done_users
+                rows += done_rows
+
+            if since is None:
+                # users that no longer qualify keep nothing from earlier runs
+                UserRecommendation.objects.filter(computed_at__lt=run.started_at).delete()
+        except BaseException:
+            run.status = RecommendationRun.STATUS_FAILED
+            run.finished_at = timezone.now()
+            run.save(update_fields=["status", "finished_at"])
+            raise
+
+        run.status = RecommendationRun.STATUS_SUCCEEDED
+        run.finished_at = timezone.now()
+        run.users, run.rows = users, rows
+        run.save(update_fields=["status", "finished_at", "users", "rows"])
+        serving.bump_model_version()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"Stored {rows} recommendations for {users} users in {elapsed:.2f}s.")
+
+    def _run_shards(self, shards, state, workers):
+        if workers == 1:
+            for shard in shards:
+                yield personal.score_shard(state, shard)
+            return
+        # forked workers must open their own database connections
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=personal.init_worker, initargs=(state,)) as pool:
+            for future in as_completed([pool.submit(personal.run_shard, shard) for shard in shards]):
+                yield future.result()
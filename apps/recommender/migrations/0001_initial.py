@@ -0,0 +1,64 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = [
+        ("books", "0003_book_created_at_id_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookNeighbor",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("co_purchase", "Customers also bought")],
+                        default="co_purchase",
+                        max_length=20,
+                    ),
+                ),
+                ("score", models.FloatField()),
+                ("rank", models.PositiveSmallIntegerField()),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="neighbors",
+                        to="books.book",
+                    ),
+                ),
+                (
+                    "neighbor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="books.book",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["book", "kind", "rank"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("book", "kind", "rank"),
+                        name="unique_book_neighbor_rank",
+                    )
+                ],
+            },
+        ),
+    ]
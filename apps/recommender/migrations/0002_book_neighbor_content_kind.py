@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recommender", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="bookneighbor",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("co_purchase", "Customers also bought"),
+                    ("content", "Similar books"),
+                ],
+                default="co_purchase",
+                max_length=20,
+            ),
+        ),
+    ]
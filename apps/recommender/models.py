@@ -1,3 +1,84 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+from apps.books.models import Book
+
+
+class BookNeighbor(models.Model):
+    """One precomputed "similar book" of ``book``, ranked within its ``kind``.
+
+    The table is rebuilt offline (see ``build_recommendations``); pages only
+    read the top rows for a book through the ``(book, kind, rank)`` index.
+    """
+
+    KIND_CO_PURCHASE = "co_purchase"
+    KIND_CONTENT = "content"
+
+    KIND_CHOICES = [
+        (KIND_CO_PURCHASE, "Customers also bought"),
+        (KIND_CONTENT, "Similar books"),
+    ]
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="neighbors")
+    neighbor = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="+")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default=KIND_CO_PURCHASE)
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ["book", "kind", "rank"]
+        constraints = [
+            models.UniqueConstraint(fields=["book", "kind", "rank"], name="unique_book_neighbor_rank"),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.neighbor_id} ({self.kind} #{self.rank}, {self.score:.3f})"
+
+
+class RecommendationRun(models.Model):
+    """One run of ``build_user_recommendations``; the start of the last
+    successful run is the watermark of the next incremental one."""
+
+    STATUS_RUNNING = "RUNNING"
+    STATUS_SUCCEEDED = "SUCCEEDED"
+    STATUS_FAILED = "FAILED"
+
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, "Running"),
+        (STATUS_SUCCEEDED, "Succeeded"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    incremental = models.BooleanField(default=False)
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    users = models.PositiveIntegerField(default=0)
+    rows = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-started_at"]
+
+    def __str__(self):
+        kind = "incremental" if self.incremental else "full"
+        return f"RecommendationRun({self.pk}, {kind}, {self.status})"
+
+
+class UserRecommendation(models.Model):
+    """A precomputed recommendation for ``user``, ranked from 1."""
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="recommendations")
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["user", "rank"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "rank"], name="unique_user_recommendation_rank"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.book_id} (#{self.rank}, {self.score:.3f})"
@@ -0,0 +1,48 @@
+"""Helpers shared by the builders of the ``BookNeighbor`` tables."""
+import numpy as np
+from django.db import transaction
+
+from .models import BookNeighbor
+from .serving import bump_model_version
+
+
+def top_k(S, k, min_score=0.0, exclude=None):
+    """Yield ``(row, cols, scores)`` with the ``k`` best entries of each row
+    of CSR ``S`` scoring above ``min_score``, best first (ties go to the lower
+    column). ``exclude[row]`` is a column to skip in that row (the book
+    itself); rows left empty are not yielded."""
+    for row in range(S.shape[0]):
+        start, end = S.indptr[row], S.indptr[row + 1]
+        cols, scores = S.indices[start:end], S.data[start:end]
+        keep = scores > min_score
+        if exclude is not None:
+            keep &= cols != exclude[row]
+        cols, scores = cols[keep], scores[keep]
+        if not len(scores):
+            continue
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            cols, scores = cols[best], scores[best]
+        order = np.lexsort((cols, -scores))
+        yield row, cols[order], scores[order]
+
+
+def neighbor_rows(kind, book_id, neighbor_ids, scores):
+    """Unsaved ``BookNeighbor`` rows for one book, ranked from 1."""
+    return [
+        BookNeighbor(book_id=int(book_id), neighbor_id=int(other), kind=kind, score=float(score), rank=rank)
+        for rank, (other, score) in enumerate(zip(neighbor_ids, scores), start=1)
+    ]
+
+
+def replace(kind, rows, book_ids=None, batch_size=1000):
+    """Atomically swap the ``kind`` table (or, with ``book_ids``, just those
+    books' neighbours) for ``rows``."""
+    current = BookNeighbor.objects.filter(kind=kind)
+    if book_ids is not None:
+        current = current.filter(book_id__in=list(book_ids))
+    with transaction.atomic():
+        current.delete()
+        BookNeighbor.objects.bulk_create(rows, batch_size=batch_size)
+        transaction.on_commit(bump_model_version)
+    return len(rows)
@@ -0,0 +1,149 @@
+"""Precomputed per-user recommendations.
+
+A user's candidates are the precomputed neighbours (``BookNeighbor``) of the
+books they bought, scored in bulk for a shard of users at once:
+
+    H = users x books purchase history (binary, cancelled orders ignored)
+    N = books x books neighbour weights (co-purchase + weighted content)
+    S = H N                                  candidate scores
+
+Books the user already owns are removed and the top ``k`` of each row are
+written as ``UserRecommendation`` rows, replacing that user's old ones.
+Rows left short are topped up with best sellers they don't own.
+
+``build_user_recommendations`` loads ``N`` once, fans the user-id shards out
+over a process pool and calls ``score_shard`` in each worker.
+"""
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+from scipy import sparse
+
+from apps.orders.models import Order, OrderItem
+
+from .co_purchase import IGNORED_STATUSES
+from .models import BookNeighbor, UserRecommendation
+from .neighbors import top_k
+from .serving import best_sellers
+
+# weight of each neighbour kind in a candidate's score
+KIND_WEIGHTS = {BookNeighbor.KIND_CO_PURCHASE: 1.0, BookNeighbor.KIND_CONTENT: 0.5}
+# best sellers kept to top up short lists
+POPULAR_BOOKS = 100
+
+
+class ScoringState:
+    """What every shard needs: the neighbour matrix and the best sellers."""
+
+    def __init__(self, k):
+        self.k = k
+        rows = np.array(
+            BookNeighbor.objects.filter(kind__in=KIND_WEIGHTS).values_list("book_id", "neighbor_id", "kind", "score"),
+            dtype=object,
+        ).reshape(-1, 4)
+        self.book_ids = np.unique(rows[:, :2].astype(np.int64))
+        weights = np.array([KIND_WEIGHTS[kind] for kind in rows[:, 2]], dtype=np.float32)
+        self.neighbors = sparse.csr_matrix(
+            (
+                weights * rows[:, 3].astype(np.float32),
+                (self.column(rows[:, 0].astype(np.int64)), self.column(rows[:, 1].astype(np.int64))),
+            ),
+            shape=(len(self.book_ids), len(self.book_ids)),
+        )
+        self.popular = best_sellers(POPULAR_BOOKS)
+
+    def column(self, book_ids):
+        return np.searchsorted(self.book_ids, book_ids)
+
+
+def purchases(user_ids):
+    """``{user_id: set of book ids}`` bought by ``user_ids``."""
+    bought = {}
+    rows = (
+        OrderItem.objects.filter(order__user_id__in=user_ids)
+        .exclude(order__status__in=IGNORED_STATUSES)
+        .values_list("order__user_id", "book_id")
+        .distinct()
+    )
+    for user_id, book_id in rows:
+        bought.setdefault(user_id, set()).add(book_id)
+    return bought
+
+
+def recommend(state, user_ids):
+    """``{user_id: [(book_id, score), ...]}``, best first, for the users of
+    ``user_ids`` that have a purchase history."""
+    bought = purchases(user_ids)
+    users = sorted(bought)
+    if not users:
+        return {}
+
+    # history restricted to books that have neighbours (others add nothing)
+    rows, cols = [], []
+    for row, user_id in enumerate(users):
+        owned = np.fromiter(bought[user_id], dtype=np.int64)
+        pos = state.column(owned)
+        known = pos < len(state.book_ids)
+        known[known] = state.book_ids[pos[known]] == owned[known]
+        rows.extend([row] * int(known.sum()))
+        cols.extend(pos[known])
+    H = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(len(users), len(state.book_ids))
+    )
+    S = (H @ state.neighbors).tocsr()
+    S = (S - S.multiply(H)).tocsr()  # drop books the user owns
+    S.eliminate_zeros()
+
+    result = {user_id: [] for user_id in users}
+    for row, best, scores in top_k(S, state.k):
+        result[users[row]] = list(zip(state.book_ids[best].tolist(), scores.tolist()))
+    for user_id, picks in result.items():
+        if len(picks) < state.k:
+            taken = bought[user_id] | {book_id for book_id, _ in picks}
+            fill = [book_id for book_id in state.popular if book_id not in taken]
+            picks.extend((book_id, 0.0) for book_id in fill[: state.k - len(picks)])
+    return result
+
+
+def write(user_ids, recommendations, batch_size=1000):
+    """Replace the stored recommendations of ``user_ids``; returns rows written."""
+    now = timezone.now()
+    rows = [
+        UserRecommendation(user_id=user_id, book_id=book_id, score=score, rank=rank, computed_at=now)
+        for user_id, picks in recommendations.items()
+        for rank, (book_id, score) in enumerate(picks, start=1)
+    ]
+    with transaction.atomic():
+        UserRecommendation.objects.filter(user_id__in=user_ids).delete()
+        UserRecommendation.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def score_shard(state, user_ids):
+    """Recompute and store one shard; returns ``(users, rows)``."""
+    return len(user_ids), write(user_ids, recommend(state, user_ids))
+
+
+def users_to_score(since=None):
+    """Ids of active users with orders, or only those whose orders changed
+    at or after ``since`` (including cancellations, which can empty a list)."""
+    orders = Order.objects.filter(user__is_active=True)
+    if since is None:
+        orders = orders.exclude(status__in=IGNORED_STATUSES)
+    else:
+        orders = orders.filter(updated_at__gte=since)
+    return sorted(orders.order_by().values_list("user_id", flat=True).distinct())
+
+
+# -- process pool workers ---------------------------------------------------
+
+_worker_state = None
+
+
+def init_worker(state):
+    global _worker_state
+    _worker_state = state
+
+
+def run_shard(user_ids):
+    return score_shard(_worker_state, user_ids)
@@ -0,0 +1,386 @@
+"""Semantic search and "related titles" over a local vector index.
+
+Books and queries are embedded offline by the embedder in
+``settings.RECOMMENDER_EMBEDDER`` (default ``HashingEmbedder``: the hashed
+features of ``features.py`` folded into a small dense vector, so no model
+download or API call is needed). Vectors are kept in the index selected
+with ``settings.RECOMMENDER_VECTOR_BACKEND``:
+
+* ``NumpyVectorIndex`` (default) keeps them in this process and scores
+  every book with one matrix product (exact; fine for a catalog of this
+  size). Each worker fills its own copy on its first lookup and, whenever
+  the catalog version has moved since, re-embeds the books written in the
+  meantime (by any process) and drops deleted ones.
+* ``ChromaVectorIndex`` stores them in the Chroma server at
+  ``RECOMMENDER_CHROMA_URL`` (HNSW, cosine), shared by every worker. Without
+  a URL it opens an embedded persistent collection under
+  ``RECOMMENDER_VECTOR_PATH``, which needs the full ``chromadb`` package
+  (the pinned ``chromadb-client`` is HTTP-only) and a single process, as
+  Chroma does not support several processes on one embedded store.
+
+If the configured backend cannot start the numpy index is used instead. An
+empty index is filled from the database on first use; after that ``Book``
+writes are queued and upserted in one batch when their transaction commits.
+"""
+import logging
+import threading
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from apps.books.cache import catalog_cache_timeout, catalog_key, get_catalog_version
+from apps.books.models import Book
+from apps.books.search import get_result_cache, tokenize
+
+from .features import FIELD_WEIGHTS, book_features, text_features
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDER = "apps.recommender.semantic.HashingEmbedder"
+DEFAULT_VECTOR_BACKEND = "apps.recommender.semantic.NumpyVectorIndex"
+
+# results kept for one semantic search (they are paginated like keyword search)
+SEARCH_RESULTS = 60
+BATCH_SIZE = 500
+
+
+class HashingEmbedder:
+    """Signed feature hashing of ``features.py`` into ``dimensions`` floats.
+
+    Each hashed feature adds its (log-scaled) weight to one coordinate with
+    a sign taken from another bit of its hash, and vectors are L2-normalised.
+    Books sharing words, phrases, authors or genres end up close; it is
+    lexical similarity, but fully offline and deterministic.
+    """
+
+    dimensions = 256
+    # what the search UI calls matches of this embedder
+    label = "similar wording"
+
+    def _vector(self, counts):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        if counts:
+            features = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            weights = np.log1p(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+            signs = np.where(features & (1 << 17), 1.0, -1.0).astype(np.float32)
+            np.add.at(vector, features % self.dimensions, signs * weights)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_books(self, books):
+        return np.array([self._vector(book_features(book)) for book in books], dtype=np.float32).reshape(
+            -1, self.dimensions
+        )
+
+    def embed_query(self, text):
+        return self._vector(text_features(text))
+
+
+class BaseVectorIndex:
+    """Interface shared by the vector indexes.
+
+    ``query`` returns ``(book_id, similarity)`` pairs, most similar first.
+    ``shared`` is True when every process sees the same index, so a rebuild
+    in one (e.g. a management command) reaches the web workers.
+    """
+
+    shared = False
+
+    def upsert(self, book_ids, vectors):
+        raise NotImplementedError
+
+    def delete(self, book_ids):
+        raise NotImplementedError
+
+    def query(self, vector, limit):
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def book_ids(self):
+        """Ids of the indexed books (needed by unshared indexes only)."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class ChromaVectorIndex(BaseVectorIndex):
+    """Chroma collection ``books`` (cosine space), embedded or remote."""
+
+    COLLECTION = "books"
+
+    def __init__(self):
+        import chromadb
+
+        url = getattr(settings, "RECOMMENDER_CHROMA_URL", "")
+        chroma_settings = chromadb.Settings(anonymized_telemetry=False)
+        if url:
+            from urllib.parse import urlsplit
+
+            parts = urlsplit(url)
+            self.client = chromadb.HttpClient(
+                host=parts.hostname, port=parts.port or 8000, ssl=parts.scheme == "https", settings=chroma_settings
+            )
+            self.shared = True
+        else:
+            path = getattr(settings, "RECOMMENDER_VECTOR_PATH", settings.BASE_DIR / "vector_index")
+            self.client = chromadb.PersistentClient(path=str(path), settings=chroma_settings)
+        self.collection = self._collection()
+
+    def _collection(self):
+        # embeddings are always passed in; no embedding function is needed
+        return self.client.get_or_create_collection(
+            self.COLLECTION, metadata={"hnsw:space": "cosine"}, embedding_function=None
+        )
+
+    def upsert(self, book_ids, vectors):
+        step = min(BATCH_SIZE, self.client.get_max_batch_size())
+        for start in range(0, len(book_ids), step):
+            self.collection.upsert(
+                ids=[str(pk) for pk in book_ids[start:start + step]],
+                embeddings=np.asarray(vectors[start:start + step]),
+            )
+
+    def delete(self, book_ids):
+        if book_ids:
+            self.collection.delete(ids=[str(pk) for pk in book_ids])
+
+    def query(self, vector, limit):
+        limit = min(limit, self.count())
+        if not limit:
+            return []
+        result = self.collection.query(query_embeddings=[np.asarray(vector)], n_results=limit, include=["distances"])
+        return [(int(pk), 1.0 - distance) for pk, distance in zip(result["ids"][0], result["distances"][0])]
+
+    def count(self):
+        return self.collection.count()
+
+    def clear(self):
+        self.client.delete_collection(self.COLLECTION)
+        self.collection = self._collection()
+
+
+class NumpyVectorIndex(BaseVectorIndex):
+    """In-process matrix of book vectors, searched exhaustively."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}  # book id -> row in _vectors
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._vectors = None
+
+    def upsert(self, book_ids, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+            new = [i for i, pk in enumerate(book_ids) if pk not in self._rows]
+            for i, pk in enumerate(book_ids):
+                if pk in self._rows:
+                    self._vectors[self._rows[pk]] = vectors[i]
+            if new:
+                start = len(self._ids)
+                self._vectors = np.vstack([self._vectors, vectors[new]])
+                self._ids = np.concatenate([self._ids, np.asarray([book_ids[i] for i in new], dtype=np.int64)])
+                self._rows.update((int(pk), start + n) for n, pk in enumerate(self._ids[start:]))
+
+    def delete(self, book_ids):
+        with self._lock:
+            drop = [self._rows[pk] for pk in book_ids if pk in self._rows]
+            if not drop:
+                return
+            keep = np.ones(len(self._ids), dtype=bool)
+            keep[drop] = False
+            self._ids, self._vectors = self._ids[keep], self._vectors[keep]
+            self._rows = {int(pk): row for row, pk in enumerate(self._ids)}
+
+    def query(self, vector, limit):
+        with self._lock:
+            if not len(self._ids):
+                return []
+            scores = self._vectors @ np.asarray(vector, dtype=np.float32)
+            limit = min(limit, len(scores))
+            best = np.argpartition(-scores, limit - 1)[:limit]
+            best = best[np.argsort(-scores[best], kind="stable")]
+            return [(int(self._ids[row]), float(scores[row])) for row in best]
+
+    def count(self):
+        return len(self._ids)
+
+    def book_ids(self):
+        with self._lock:
+            return self._ids.tolist()
+
+    def clear(self):
+        with self._lock:
+            self._rows, self._ids, self._vectors = {}, np.zeros(0, dtype=np.int64), None
+
+
+@lru_cache(maxsize=None)
+def get_embedder():
+    return import_string(getattr(settings, "RECOMMENDER_EMBEDDER", DEFAULT_EMBEDDER))()
+
+
+def search_label():
+    """How the UI describes semantic matches of the configured embedder."""
+    return getattr(get_embedder(), "label", "related meaning")
+
+
+_index_lock = threading.Lock()
+# (catalog version, start time) of this process's last fill or catch-up
+_synced = None
+
+
+@lru_cache(maxsize=None)
+def _vector_index():
+    path = getattr(settings, "RECOMMENDER_VECTOR_BACKEND", DEFAULT_VECTOR_BACKEND)
+    try:
+        return import_string(path)()
+    except Exception:
+        logger.warning("Vector backend %s unavailable, using NumpyVectorIndex", path, exc_info=True)
+        return NumpyVectorIndex()
+
+
+def get_vector_index(fill=True):
+    """Return the process-wide vector index, filled from the database the
+    first time it is found empty (unless ``fill`` is False).
+
+    An unshared index is caught up with the database whenever the catalog
+    version moved since it was last synced.
+    """
+    global _synced
+    index = _vector_index()
+    if not fill or (_synced is not None and (index.shared or _synced[0] == get_catalog_version())):
+        return index
+    with _index_lock:
+        version, started = get_catalog_version(), timezone.now()
+        if _synced is None:
+            if not index.count():
+                _fill(index)
+        elif index.shared or _synced[0] == version:
+            return index
+        else:
+            _catch_up(index, since=_synced[1])
+        _synced = (version, started)
+    return index
+
+
+def _fill(index, batch_size=BATCH_SIZE):
+    """Embed every book into ``index`` in batches; returns how many."""
+    embedder, total = get_embedder(), 0
+    books = Book.objects.only(*FIELD_WEIGHTS).order_by("id")
+    batch = []
+    for book in books.iterator(chunk_size=batch_size):
+        batch.append(book)
+        if len(batch) == batch_size:
+            index.upsert([b.pk for b in batch], embedder.embed_books(batch))
+            total, batch = total + len(batch), []
+    if batch:
+        index.upsert([b.pk for b in batch], embedder.embed_books(batch))
+        total += len(batch)
+    return total
+
+
+def _catch_up(index, since):
+    """Re-embed the books written since ``since`` and drop deleted ones."""
+    books = list(Book.objects.filter(updated_at__gte=since).only(*FIELD_WEIGHTS))
+    if books:
+        index.upsert([b.pk for b in books], get_embedder().embed_books(books))
+    index.delete(sorted(set(index.book_ids()) - set(Book.objects.values_list("id", flat=True))))
+
+
+def rebuild():
+    """Re-embed the whole catalog into a cleared index; returns the count."""
+    global _synced
+    index = get_vector_index(fill=False)
+    with _index_lock:
+        version, started = get_catalog_version(), timezone.now()
+        index.clear()
+        total = _fill(index)
+        _synced = (version, started)
+    return total
+
+
+def index_books(book_ids):
+    """Upsert the given books (those no longer in the database are removed)."""
+    books = list(Book.objects.filter(pk__in=book_ids).only(*FIELD_WEIGHTS))
+    index = get_vector_index()
+    if books:
+        index.upsert([b.pk for b in books], get_embedder().embed_books(books))
+    index.delete(sorted(set(book_ids) - {b.pk for b in books}))
+
+
+# -- batched updates from the Book signals ----------------------------------
+
+_pending = threading.local()
+
+
+def queue_update(book_id):
+    """Upsert ``book_id`` (or drop it, if deleted) once the current
+    transaction commits, together with the other books written in it."""
+    if not hasattr(_pending, "ids"):
+        _pending.ids = set()
+    _pending.ids.add(book_id)
+    # every write registers a flush; the first one to run takes the batch
+    transaction.on_commit(flush_updates)
+
+
+def flush_updates():
+    ids = getattr(_pending, "ids", None)
+    if not ids:
+        return
+    _pending.ids = set()
+    try:
+        index_books(sorted(ids))
+    except Exception:
+        logger.exception("Vector index update failed for %d book(s)", len(ids))
+
+
+# -- lookups ------------------------------------------------------------------
+
+
+def search(query, limit=SEARCH_RESULTS):
+    """Ids of the books closest to ``query``, best first.
+
+    Results are cached like keyword searches (per process, per catalog
+    version). Returns an empty tuple if the index fails.
+    """
+    text = " ".join(tokenize(query))
+    if not text:
+        return ()
+    result_cache = get_result_cache()
+    key, version = f"semantic:{text}", get_catalog_version()
+    ids = result_cache.get(key, version)
+    if ids is None:
+        try:
+            hits = get_vector_index().query(get_embedder().embed_query(text), limit)
+        except Exception:
+            logger.exception("Semantic search failed")
+            return ()
+        ids = tuple(pk for pk, _ in hits)
+        result_cache.set(key, version, ids)
+    return ids
+
+
+def related(book, limit):
+    """Ids of the ``limit`` books closest to ``book`` (cached per catalog
+    version in the shared cache)."""
+    key = catalog_key("related", book.pk, limit)
+    ids = cache.get(key)
+    if ids is None:
+        try:
+            vector = get_embedder().embed_books([book])[0]
+            hits = get_vector_index().query(vector, limit + 1)
+        except Exception:
+            logger.exception("Related titles lookup failed")
+            return []
+        ids = [pk for pk, _ in hits if pk != book.pk][:limit]
+        cache.set(key, ids, catalog_cache_timeout())
+    return ids
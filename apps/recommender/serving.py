@@ -0,0 +1,178 @@
+"""Serving precomputed recommendations from the cache.
+
+Pages and the API read ranked book ids from the precomputed tables
+(``UserRecommendation``, ``BookNeighbor``) through the cache, so a warm
+request makes no database query:
+
+* ranked lists are cached per user / book / cart book under the *model
+  version*, a counter bumped whenever a build job (or an incremental
+  content update) rewrites the tables;
+* out-of-stock books are dropped at read time using the set of out-of-stock
+  ids, cached per catalog and availability version;
+* the small book "cards" rendered for each pick are cached per book and
+  dropped when that book is saved (see ``signals.py``).
+
+Users without precomputed picks, and anonymous visitors, get best sellers.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from apps.books.cache import catalog_key, get_availability_version, get_catalog_version
+from apps.books.models import Book
+from apps.orders.models import Order, OrderItem
+
+from .models import BookNeighbor, UserRecommendation
+
+MODEL_VERSION_KEY = "recommender:model_version"
+
+# ids kept per cached list; the slack absorbs out-of-stock books
+CANDIDATES = 50
+CARD_FIELDS = ("title", "slug", "author", "price")
+
+_out_of_stock = (None, frozenset())  # (versions, ids), per process
+
+
+def cache_timeout():
+    return getattr(settings, "RECOMMENDER_CACHE_TIMEOUT", 60 * 60)
+
+
+def get_model_version():
+    version = cache.get(MODEL_VERSION_KEY)
+    if version is None:
+        cache.add(MODEL_VERSION_KEY, 1, timeout=None)
+        version = cache.get(MODEL_VERSION_KEY, 1)
+    return version
+
+
+def bump_model_version():
+    """Make every cached list stale (call after rewriting the tables)."""
+    try:
+        return cache.incr(MODEL_VERSION_KEY)
+    except ValueError:
+        cache.set(MODEL_VERSION_KEY, 2, timeout=None)
+        return 2
+
+
+def best_sellers(limit):
+    """Ids of the books bought by the most users."""
+    return list(
+        OrderItem.objects.exclude(order__status=Order.STATUS_CANCELLED)
+        .values("book_id")
+        .annotate(buyers=Count("order__user_id", distinct=True))
+        .order_by("-buyers", "book_id")
+        .values_list("book_id", flat=True)[:limit]
+    )
+
+
+def _ranked(name, loader):
+    key = f"recommender:v{get_model_version()}:{name}"
+    ids = cache.get(key)
+    if ids is None:
+        ids = loader()
+        cache.set(key, ids, cache_timeout())
+    return ids
+
+
+def popular_ids():
+    return _ranked("popular", lambda: best_sellers(CANDIDATES))
+
+
+def user_ids(user_id):
+    def load():
+        rows = UserRecommendation.objects.filter(user_id=user_id).order_by("rank")
+        return list(rows.values_list("book_id", flat=True)[:CANDIDATES])
+
+    return _ranked(f"user:{user_id}", load) or popular_ids()
+
+
+def book_ids(book_id, kind=None):
+    """Neighbours of a book: one ``kind``, or co-purchase first then content."""
+    def load():
+        rows = BookNeighbor.objects.filter(book_id=book_id).values_list("neighbor_id", "kind")
+        ranked = sorted(rows.order_by("rank"), key=lambda row: row[1] != BookNeighbor.KIND_CO_PURCHASE)
+        ids = []
+        for neighbor_id, row_kind in ranked:
+            if (kind is None or row_kind == kind) and neighbor_id not in ids:
+                ids.append(neighbor_id)
+        return ids[:CANDIDATES]
+
+    return _ranked(f"book:{book_id}:{kind or 'all'}", load)
+
+
+def cart_ids(cart_book_ids):
+    """Neighbours of the cart's books, interleaved so each book contributes."""
+    lists = [book_ids(pk) for pk in sorted(set(cart_book_ids))]
+    ids = []
+    for rank in range(max(map(len, lists), default=0)):
+        for neighbors in lists:
+            if rank < len(neighbors) and neighbors[rank] not in ids:
+                ids.append(neighbors[rank])
+    return ids or popular_ids()
+
+
+def out_of_stock_ids():
+    """Ids of the books with no stock, for the current catalog and
+    availability versions (checkouts only move the latter when a book sells
+    out or comes back)."""
+    global _out_of_stock
+    version = (get_catalog_version(), get_availability_version())
+    if _out_of_stock[0] != version:
+        key = catalog_key("out_of_stock", f"a{version[1]}")
+        ids = cache.get(key)
+        if ids is None:
+            ids = frozenset(Book.objects.filter(stock__lte=0).values_list("id", flat=True))
+            cache.set(key, ids, cache_timeout())
+        _out_of_stock = (version, ids)
+    return _out_of_stock[1]
+
+
+def reset():
+    """Forget this process's copy of the out-of-stock ids (e.g. after the
+    cache holding the versions was cleared)."""
+    global _out_of_stock
+    _out_of_stock = (None, frozenset())
+
+
+def card_key(book_id):
+    return f"recommender:card:{book_id}"
+
+
+def cards(ids):
+    """Render data of the books ``ids``, in order (missing books skipped)."""
+    found = {int(key.rsplit(":", 1)[1]): card for key, card in cache.get_many([card_key(pk) for pk in ids]).items()}
+    missing = [pk for pk in ids if pk not in found]
+    if missing:
+        fresh = {
+            book.pk: {
+                "id": book.pk,
+                "title": book.title,
+                "author": book.author,
+                "price": str(book.price),
+                "url": book.get_absolute_url(),
+            }
+            for book in Book.objects.filter(pk__in=missing).only(*CARD_FIELDS)
+        }
+        cache.set_many({card_key(pk): card for pk, card in fresh.items()}, cache_timeout())
+        found.update(fresh)
+    return [found[pk] for pk in ids if pk in found]
+
+
+def pick(ids, limit, exclude=()):
+    """Cards of the first ``limit`` in-stock books of ``ids`` not in ``exclude``."""
+    skip = out_of_stock_ids() | set(exclude)
+    return cards([pk for pk in ids if pk not in skip][:limit])
+
+
+def for_user(user, limit):
+    if user is None or not user.is_authenticated:
+        return pick(popular_ids(), limit)
+    return pick(user_ids(user.pk), limit)
+
+
+def for_book(book_id, limit, kind=None):
+    return pick(book_ids(book_id, kind), limit, exclude=(book_id,))
+
+
+def for_cart(cart_book_ids, limit):
+    return pick(cart_ids(cart_book_ids), limit, exclude=cart_book_ids)
@@ -0,0 +1,72 @@
+# apps/recommender/signals.py
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from apps.books.models import Book
+from apps.orders import outbox
+
+from .features import FIELD_WEIGHTS
+from .models import BookNeighbor
+from .serving import card_key
+
+CONTENT_NEIGHBORS = "content_neighbors"
+
+
+def _live_updates():
+    return getattr(settings, "RECOMMENDER_CONTENT_UPDATES", True)
+
+
+@receiver(post_save, sender=Book)
+def reindex_book_content(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Queue the book's content neighbours for the outbox worker and refresh
+    its vector once the write is committed."""
+    if raw or not _live_updates():
+        return
+    if update_fields is not None and not set(update_fields) & set(FIELD_WEIGHTS):
+        return  # no indexed text changed (price/stock edit)
+
+    # numpy/scipy are only imported when a book is actually written
+    from .semantic import queue_update
+
+    outbox.enqueue(CONTENT_NEIGHBORS, {"book_id": instance.pk})
+    queue_update(instance.pk)
+
+
+@receiver(pre_delete, sender=Book)
+def unindex_book_content(sender, instance, **kwargs):
+    """Queue a refresh of the books listing ``instance``: their rows pointing
+    at it are deleted with it."""
+    if not _live_updates():
+        return
+    listed_by = list(
+        BookNeighbor.objects.filter(kind=BookNeighbor.KIND_CONTENT, neighbor=instance).values_list("book_id", flat=True)
+    )
+    if listed_by:
+        outbox.enqueue(CONTENT_NEIGHBORS, {"listed_by": listed_by})
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book_vector(sender, instance, **kwargs):
+    if not _live_updates():
+        return
+    from .semantic import queue_update
+
+    queue_update(instance.pk)
+
+
+@outbox.register(CONTENT_NEIGHBORS)
+def update_content_neighbors(payload):
+    from .content import update_neighbors
+
+    update_neighbors(payload.get("book_id"), payload.get("listed_by", ()))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def drop_book_card(sender, instance, **kwargs):
+    """Recommendation lists render cached cards; refresh this book's."""
+    key = card_key(instance.pk)
+    transaction.on_commit(lambda: cache.delete(key))
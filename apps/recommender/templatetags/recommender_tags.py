@@ -0,0 +1,21 @@
+from django import template
+
+from apps.recommender import serving
+
+register = template.Library()
+
+
+@register.inclusion_tag("recommender/books.html")
+def recommendations(title, user=None, book=None, cart=None, kind=None, limit=4):
+    """Render a row of recommended books from the cache.
+
+    Pass ``book`` for its neighbours (optionally one ``kind``), ``cart`` (the
+    cart items) for cart suggestions, or ``user`` for their own picks.
+    """
+    if book is not None:
+        books = serving.for_book(book.pk, limit, kind)
+    elif cart is not None:
+        books = serving.for_cart([item.book_id for item in cart], limit)
+    else:
+        books = serving.for_user(user, limit)
+    return {"title": title, "books": books}
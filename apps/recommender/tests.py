@@ -1,3 +1,149 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from apps.books.cache import bump_catalog_version, bump_stock_version
+from apps.books.models import Book
+from apps.orders import outbox
+from apps.orders.models import OutboxMessage
+
+from . import semantic, serving
+from .models import BookNeighbor, UserRecommendation
+from .signals import CONTENT_NEIGHBORS
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    RECOMMENDER_CONTENT_UPDATES=False,
+)
+class RecommendationServingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = Book.objects.bulk_create(
+            [Book(title=f"Book {i}", slug=f"book-{i}", price=10, stock=5) for i in range(40)]
+        )
+        cls.user = get_user_model().objects.create_user("reader", "reader@example.com", "pw")
+        BookNeighbor.objects.bulk_create(
+            BookNeighbor(book=book, neighbor=cls.books[(i + r) % 40], score=1 / r, rank=r)
+            for i, book in enumerate(cls.books)
+            for r in range(1, 11)
+        )
+        UserRecommendation.objects.bulk_create(
+            UserRecommendation(user=cls.user, book=cls.books[r], score=1 / r, rank=r) for r in range(1, 21)
+        )
+
+    def setUp(self):
+        cache.clear()
+        serving.reset()
+        self.client = APIClient()
+
+    def test_warm_reads_are_served_from_the_cache(self):
+        book = self.books[0]
+        serving.for_user(self.user, 8)
+        serving.for_book(book.pk, 8)
+        self.assertIsNotNone(cache.get(f"recommender:v{serving.get_model_version()}:user:{self.user.pk}"))
+        self.assertIsNotNone(cache.get(serving.card_key(self.books[1].pk)))
+        with self.assertNumQueries(0):
+            self.assertEqual([c["id"] for c in serving.for_user(self.user, 3)], [b.pk for b in self.books[1:4]])
+            self.assertEqual(len(serving.for_book(book.pk, 8)), 8)
+
+    def test_warm_api_requests_make_no_queries(self):
+        self.client.force_authenticate(self.user)
+        urls = ["/api/recommendations/", f"/api/recommendations/?book={self.books[0].pk}"]
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()["results"]), 8)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).json(), response.json())
+
+    def test_out_of_stock_books_are_dropped_at_read_time(self):
+        first = self.books[1]
+        self.assertEqual(serving.for_user(self.user, 1)[0]["id"], first.pk)
+        # a book selling out bumps the availability version, like inventory does
+        Book.objects.filter(pk=first.pk).update(stock=0)
+        bump_stock_version(availability=True)
+        self.assertEqual(serving.for_user(self.user, 1)[0]["id"], self.books[2].pk)
+
+    def test_model_version_bump_changes_catalog_etag(self):
+        self.client.get("/")
+        response = self.client.get("/")
+        self.assertEqual(self.client.get("/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        serving.bump_model_version()
+        self.assertEqual(self.client.get("/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+
+    def test_model_version_bump_refreshes_lists(self):
+        self.assertEqual(serving.for_user(self.user, 1)[0]["id"], self.books[1].pk)
+        UserRecommendation.objects.filter(user=self.user, rank=1).update(book=self.books[30])
+        self.assertEqual(serving.for_user(self.user, 1)[0]["id"], self.books[1].pk)
+        serving.bump_model_version()
+        self.assertEqual(serving.for_user(self.user, 1)[0]["id"], self.books[30].pk)
+
+    def test_template_tag_renders_cached_cards(self):
+        template = Template('{% load recommender_tags %}{% recommendations "Picks" book=book limit=2 %}')
+        context = Context({"book": self.books[0]})
+        template.render(context)
+        with self.assertNumQueries(0):
+            html = template.render(context)
+        self.assertIn("Picks", html)
+        self.assertIn(self.books[1].get_absolute_url(), html)
+
+
+@override_settings(RECOMMENDER_CONTENT_UPDATES=True)
+class ContentUpdateTests(TestCase):
+    def setUp(self):
+        self.dune = Book.objects.create(title="Dune", author="Frank Herbert", genre="Science fiction", price=10)
+        self.messiah = Book.objects.create(
+            title="Dune Messiah", author="Frank Herbert", genre="Science fiction", price=10
+        )
+
+    def content_neighbors(self, book):
+        return list(
+            BookNeighbor.objects.filter(book=book, kind=BookNeighbor.KIND_CONTENT).values_list("neighbor", flat=True)
+        )
+
+    def test_book_saves_are_indexed_by_the_outbox_worker(self):
+        self.assertEqual(self.content_neighbors(self.dune), [])
+        self.assertEqual(OutboxMessage.objects.filter(kind=CONTENT_NEIGHBORS).count(), 2)
+        outbox.process_batch()
+        self.assertEqual(self.content_neighbors(self.dune), [self.messiah.pk])
+        self.assertEqual(self.content_neighbors(self.messiah), [self.dune.pk])
+
+    def test_price_edits_are_not_queued(self):
+        OutboxMessage.objects.all().delete()
+        self.dune.price = 12
+        self.dune.save(update_fields=["price"])
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_deleting_a_book_refreshes_the_books_listing_it(self):
+        children = Book.objects.create(title="Children of Dune", author="Frank Herbert", price=10)
+        outbox.process_batch()
+        self.assertIn(self.messiah.pk, self.content_neighbors(self.dune))
+        self.messiah.delete()
+        outbox.process_batch()
+        self.assertEqual(self.content_neighbors(self.dune), [children.pk])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    RECOMMENDER_CONTENT_UPDATES=False,
+    RECOMMENDER_VECTOR_BACKEND="apps.recommender.semantic.NumpyVectorIndex",
+)
+class VectorIndexSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.dune = Book.objects.create(title="Dune", author="Frank Herbert", price=10)
+        self.emma = Book.objects.create(title="Emma", author="Jane Austen", price=10)
+        semantic.rebuild()
+
+    def test_writes_of_other_processes_are_picked_up_when_the_catalog_version_moves(self):
+        self.assertEqual(semantic.search("frank herbert")[0], self.dune.pk)
+        # written elsewhere: no signal reaches this process's index
+        Book.objects.filter(pk=self.emma.pk).update(author="Frank Herbert", updated_at=timezone.now())
+        self.dune.delete()
+        bump_catalog_version()
+        self.assertEqual(semantic.search("frank herbert")[0], self.emma.pk)
+        self.assertEqual(semantic.get_vector_index().book_ids(), [self.emma.pk])
@@ -1,3 +1,44 @@
-from django.shortcuts import render
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
 
-# Create your views here.
+from apps.orders.models import CartItem
+
+from . import serving
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 24
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def recommendations(request):
+    """Precomputed recommendations, served from the cache.
+
+    ``?book=<id>`` gives the book's neighbours (``&kind=co_purchase|content``
+    for one list), ``?for=cart`` suggestions for the user's cart, otherwise
+    the user's own picks (best sellers for anonymous users). ``limit``
+    defaults to 8.
+    """
+    try:
+        limit = min(max(int(request.query_params.get("limit", DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        book_id = request.query_params.get("book")
+        book_id = int(book_id) if book_id else None
+    except ValueError:
+        return Response({"error": "book and limit must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+    kind = request.query_params.get("kind") or None
+    if kind not in (None, *dict(serving.BookNeighbor.KIND_CHOICES)):
+        return Response({"error": f"unknown kind {kind!r}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    user = request.user
+    if book_id is not None:
+        source, results = "book", serving.for_book(book_id, limit, kind)
+    elif request.query_params.get("for") == "cart" and user.is_authenticated:
+        cart = CartItem.objects.filter(cart__user=user).values_list("book_id", flat=True)
+        source, results = "cart", serving.for_cart(list(cart), limit)
+    else:
+        source = "user" if user.is_authenticated else "popular"
+        results = serving.for_user(user, limit)
+    return Response({"source": source, "model_version": serving.get_model_version(), "results": results})
@@ -3,6 +3,10 @@ ASGI config for bookscart project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Production runs it under gunicorn with uvicorn workers (see the Procfile), so
+async views such as the streaming chat endpoint wait on I/O without holding
+a worker; sync views run in a thread pool.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -47,6 +47,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",   # full-text/trigram lookups for book search
       # Local apps (use dotted python path)
     accounts,
     books,
@@ -113,6 +114,21 @@ DATABASES = {
 }
 
 
+# Cache
+# Catalog caches are invalidated through a version counter stored here, so
+# deployments with several worker processes should point CACHE_URL at a
+# shared cache (e.g. rediscache://127.0.0.1:6379/1).
+# Chat conversations get their own cache (CHATBOT_MEMORY_CACHE_URL), so catalog
+# pages and fragments filling the default cache never evict live conversations.
+
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://"),
+    "chatbot_memory": env.cache(
+        "CHATBOT_MEMORY_CACHE_URL", default="locmemcache://chatbot-memory?max_entries=1000"
+    ),
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -221,6 +237,99 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
 DEFAULT_FROM_EMAIL = env("DEFAULT_FROM_EMAIL", default="no-reply@bookscart.local")
 
+# Catalog search backend used by the book list (see apps/books/search.py).
+# The default ranks results with Postgres full-text search (FTS5 on SQLite);
+# "apps.books.search.InvertedIndexSearchBackend" keeps an in-memory index and
+# "apps.books.search.DatabaseSearchBackend" restores plain icontains queries.
+BOOKS_SEARCH_BACKEND = env(
+    "BOOKS_SEARCH_BACKEND", default="apps.books.search.FullTextSearchBackend"
+)
+# Per-process LRU cache of search results (distinct normalized queries).
+BOOKS_SEARCH_CACHE_SIZE = env.int("BOOKS_SEARCH_CACHE_SIZE", default=512)
+# Lifetime (seconds) of cached catalog pages and template fragments; Book
+# writes invalidate them earlier through the catalog version.
+BOOKS_CACHE_TIMEOUT = env.int("BOOKS_CACHE_TIMEOUT", default=600)
+
+# "keyset" pages the plain book list with (created_at, id) cursors instead of
+# OFFSET/COUNT queries; "offset" restores numbered ?page= links.
+BOOKS_LIST_PAGINATION = env("BOOKS_LIST_PAGINATION", default="keyset")
+
+# Seconds a checkout may hold reserved stock before `release_reservations`
+# returns it (see apps/orders/inventory.py).
+ORDERS_RESERVATION_TTL = env.int("ORDERS_RESERVATION_TTL", default=600)
+
+# Order side effects go through the outbox and are delivered by
+# `process_outbox` (see apps/orders/outbox.py). Each placed order is POSTed
+# as JSON to every URL in ORDERS_WEBHOOK_URLS (comma separated).
+ORDERS_OUTBOX_MAX_ATTEMPTS = env.int("ORDERS_OUTBOX_MAX_ATTEMPTS", default=8)
+# sent/failed outbox rows are deleted by the worker after this many days
+ORDERS_OUTBOX_RETENTION_DAYS = env.int("ORDERS_OUTBOX_RETENTION_DAYS", default=7)
+ORDERS_WEBHOOK_URLS = env.list("ORDERS_WEBHOOK_URLS", default=[])
+
+# Seconds the order stats snapshot (apps/orders/stats.py) is cached; order
+# saves/deletes refresh it sooner.
+ORDERS_STATS_TIMEOUT = env.int("ORDERS_STATS_TIMEOUT", default=300)
+
+# The chatbot imports LangChain/OpenAI on first use (apps/chatbot/llm.py).
+# CHATBOT_WARMUP=True loads them at startup instead, e.g. with gunicorn --preload.
+CHATBOT_MODEL = env("CHATBOT_MODEL", default="gpt-4o")
+CHATBOT_WARMUP = env.bool("CHATBOT_WARMUP", default=False)
+# Connection pool size and request timeout (seconds) of the chat model's
+# HTTP clients, shared by all chats of a worker.
+CHATBOT_MAX_CONNECTIONS = env.int("CHATBOT_MAX_CONNECTIONS", default=20)
+CHATBOT_TIMEOUT = env.int("CHATBOT_TIMEOUT", default=60)
+
+# Chat conversation memory (apps/chatbot/memory.py). The cache-backed store
+# uses the "chatbot_memory" cache and shares conversations between workers
+# when CHATBOT_MEMORY_CACHE_URL points at Redis, Memcached or a database cache;
+# "apps.chatbot.memory.LocalMemoryStore" keeps them in each process (LRU,
+# CHATBOT_MEMORY_MAX_SESSIONS).
+CHATBOT_MEMORY_STORE = env("CHATBOT_MEMORY_STORE", default="apps.chatbot.memory.CacheMemoryStore")
+CHATBOT_MEMORY_CACHE = env("CHATBOT_MEMORY_CACHE", default="chatbot_memory")
+CHATBOT_MEMORY_TTL = env.int("CHATBOT_MEMORY_TTL", default=60 * 60)
+CHATBOT_MEMORY_MAX_MESSAGES = env.int("CHATBOT_MEMORY_MAX_MESSAGES", default=20)
+CHATBOT_MEMORY_MAX_TOKENS = env.int("CHATBOT_MEMORY_MAX_TOKENS", default=2000)
+CHATBOT_MEMORY_MAX_SESSIONS = env.int("CHATBOT_MEMORY_MAX_SESSIONS", default=1000)
+# Token budget for conversation history in each prompt; older turns are
+# folded into a rolling summary of at most CHATBOT_SUMMARY_WORDS words
+# (apps/chatbot/history.py). Keep it below CHATBOT_MEMORY_MAX_TOKENS.
+CHATBOT_HISTORY_TOKENS = env.int("CHATBOT_HISTORY_TOKENS", default=1500)
+CHATBOT_SUMMARY_WORDS = env.int("CHATBOT_SUMMARY_WORDS", default=150)
+
+# Cache of chatbot replies to repeated opening questions, shared by users in
+# the same situation (apps/chatbot/response_cache.py), stored in the
+# CHATBOT_RESPONSE_CACHE alias. A SIMILARITY between 0 and 1 (e.g. 0.92) also
+# reuses replies to questions whose embeddings are that close, scanning the
+# last CHATBOT_RESPONSE_CACHE_SIZE questions of a scope; 0 keeps exact matches
+# only and makes no embedding calls.
+CHATBOT_RESPONSE_CACHE = env("CHATBOT_RESPONSE_CACHE", default="default")
+CHATBOT_RESPONSE_CACHE_SIZE = env.int("CHATBOT_RESPONSE_CACHE_SIZE", default=200)
+CHATBOT_RESPONSE_CACHE_TTL = env.int("CHATBOT_RESPONSE_CACHE_TTL", default=600)
+CHATBOT_RESPONSE_CACHE_SIMILARITY = env.float("CHATBOT_RESPONSE_CACHE_SIMILARITY", default=0)
+CHATBOT_EMBEDDING_MODEL = env("CHATBOT_EMBEDDING_MODEL", default="text-embedding-3-small")
+
+# Neighbours kept per book by `manage.py build_recommendations`.
+RECOMMENDER_TOP_K = env.int("RECOMMENDER_TOP_K", default=10)
+# Update content-similar books (queued for the process_outbox worker) and the
+# vector index on each Book save (apps/recommender/content.py, semantic.py);
+# turn off for bulk imports and rebuild afterwards.
+RECOMMENDER_CONTENT_UPDATES = env.bool("RECOMMENDER_CONTENT_UPDATES", default=True)
+
+# Vector index for semantic search and related titles (apps/recommender/semantic.py).
+# NumpyVectorIndex keeps vectors in each process; ChromaVectorIndex shares them
+# through the server at RECOMMENDER_CHROMA_URL (without a URL it needs the full
+# chromadb package and a single process, persisting under RECOMMENDER_VECTOR_PATH).
+RECOMMENDER_VECTOR_BACKEND = env(
+    "RECOMMENDER_VECTOR_BACKEND", default="apps.recommender.semantic.NumpyVectorIndex"
+)
+RECOMMENDER_VECTOR_PATH = env("RECOMMENDER_VECTOR_PATH", default=str(BASE_DIR / "vector_index"))
+RECOMMENDER_CHROMA_URL = env("RECOMMENDER_CHROMA_URL", default="")
+RECOMMENDER_EMBEDDER = env("RECOMMENDER_EMBEDDER", default="apps.recommender.semantic.HashingEmbedder")
+
+# Seconds precomputed recommendation lists stay cached (apps/recommender/serving.py);
+# rebuilds make them stale sooner.
+RECOMMENDER_CACHE_TIMEOUT = env.int("RECOMMENDER_CACHE_TIMEOUT", default=60 * 60)
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework.authentication.SessionAuthentication",
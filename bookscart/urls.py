@@ -14,6 +14,7 @@ urlpatterns = [
     path("", include("apps.books.urls")),
     path("orders/", include("apps.orders.urls")),
     path("chatbot/", include("apps.chatbot.urls")),
+    path("api/recommendations/", include("apps.recommender.urls")),
 ]
 
 # In development serve media files if MEDIA_ROOT is configured